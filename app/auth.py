@@ -1,9 +1,14 @@
 import os
+import time
+import uuid
+import logging
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
-from fastapi import HTTPException
-from typing import Optional
+from fastapi import HTTPException, Request, WebSocket
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+import redis.asyncio as redis
 
 from sqlmodel import Session, select
 from app.models import AdminUser
@@ -13,6 +18,15 @@ SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")  # override in production via
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_SECONDS = 60 * 60 * 6  # 6 hours
 
+# Bearer auth on admin endpoints and agent sockets (set AUTH_ENABLED=0 to disable)
+AUTH_ENABLED = os.getenv("AUTH_ENABLED", "1") != "0"
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+# How often (seconds) a process checks Redis for new revocations
+AUTH_REVOCATION_REFRESH = float(os.getenv("AUTH_REVOCATION_REFRESH", "1"))
+
+logger = logging.getLogger("auth")
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 def get_password_hash(password: str) -> str:
@@ -25,19 +39,129 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 def create_access_token(subject: str, expires_delta: int = ACCESS_TOKEN_EXPIRE_SECONDS) -> str:
-    to_encode = {"sub": subject, "exp": datetime.utcnow() + timedelta(seconds=expires_delta)}
+    to_encode = {"sub": subject, "exp": datetime.utcnow() + timedelta(seconds=expires_delta),
+                 "jti": uuid.uuid4().hex}
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> str:
+def decode_token(token: str) -> Dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub: str = payload.get("sub")
-        if sub is None:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        return sub
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    if payload.get("sub") is None:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    return payload
+
+def verify_token(token: str) -> str:
+    return decode_token(token)["sub"]
+
+class TokenAuth:
+    """
+    Bearer token check for REST dependencies and the WebSocket handshake.
+    Verified tokens sit in a TTL-bounded LRU, so repeat requests skip the JWT
+    decode and the AdminUser lookup. Revoked token ids live in a Redis sorted
+    set (scored by expiry); each process mirrors it locally and only re-reads
+    it when the revocation version counter changes.
+    """
+
+    def __init__(self, redis_client: redis.Redis, load_admin: Callable[[str], Awaitable[Optional[AdminUser]]],
+                 cache_size: int = AUTH_CACHE_SIZE, cache_ttl: float = AUTH_CACHE_TTL):
+        self.redis = redis_client
+        self.load_admin = load_admin
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.revoked_key = "revoked_tokens"
+        self.version_key = "revoked_tokens:version"
+        # token -> (subject, jti, valid until monotonic)
+        self._cache: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._revoked: Set[str] = set()
+        self._revoked_version: Optional[str] = None
+        self._next_refresh = 0.0
+
+    async def authenticate(self, token: str) -> str:
+        """Return the admin username for a valid token, raise 401 otherwise"""
+        now = time.monotonic()
+        await self._refresh_revocations(now)
+        entry = self._cache.get(token)
+        if entry is not None:
+            subject, jti, valid_until = entry
+            if valid_until > now and jti not in self._revoked:
+                self._cache.move_to_end(token)
+                return subject
+            del self._cache[token]
+
+        payload = decode_token(token)
+        subject, jti = payload["sub"], payload.get("jti", "")
+        if jti in self._revoked:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        if not await self.load_admin(subject):
+            raise HTTPException(status_code=401, detail="Unknown user")
+
+        ttl = min(self.cache_ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            self._cache[token] = (subject, jti, now + ttl)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return subject
+
+    async def revoke(self, token: str):
+        payload = decode_token(token)
+        jti = payload.get("jti")
+        if not jti:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zadd(self.revoked_key, {jti: payload["exp"]})
+        pipe.zremrangebyscore(self.revoked_key, "-inf", time.time())
+        pipe.incr(self.version_key)
+        await pipe.execute()
+        self._revoked.add(jti)
+        self._cache.pop(token, None)
+
+    async def _refresh_revocations(self, now: float):
+        if now < self._next_refresh:
+            return
+        self._next_refresh = now + AUTH_REVOCATION_REFRESH
+        try:
+            version = await self.redis.get(self.version_key)
+            if version != self._revoked_version:
+                revoked = await self.redis.zrangebyscore(self.revoked_key, time.time(), "+inf")
+                self._revoked = set(revoked)
+                self._revoked_version = version
+        except Exception:
+            logger.exception("Failed to refresh token revocations")
+
+    async def require_admin(self, request: Request) -> str:
+        """FastAPI dependency: admin username from the Authorization header"""
+        if not AUTH_ENABLED:
+            return ""
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise HTTPException(status_code=401, detail="Not authenticated",
+                                headers={"WWW-Authenticate": "Bearer"})
+        return await self.authenticate(token)
+
+    async def require_admin_media(self, request: Request) -> str:
+        """
+        Like require_admin, but also accepts ?token=... for URLs handed to
+        <audio>/<video> elements, which cannot set an Authorization header
+        """
+        token = request.query_params.get("token")
+        if not AUTH_ENABLED or not token:
+            return await self.require_admin(request)
+        return await self.authenticate(token)
+
+    async def websocket_admin(self, websocket: WebSocket) -> Optional[str]:
+        """Admin username for a handshake carrying ?token=..., None if rejected"""
+        if not AUTH_ENABLED:
+            return ""
+        token = websocket.query_params.get("token")
+        if not token:
+            return None
+        try:
+            return await self.authenticate(token)
+        except HTTPException:
+            return None
 
 # DB helpers
 def get_admin_by_username(session: Session, username: str) -> Optional[AdminUser]:
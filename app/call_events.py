@@ -0,0 +1,83 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+logger = logging.getLogger("call_events")
+
+# Number of recent events kept for resync; older clients get a full reload
+CALL_EVENT_LOG_SIZE = int(os.getenv("CALL_EVENT_LOG_SIZE", "500"))
+
+CALL_ADDED = "call_added"
+CALL_CLAIMED = "call_claimed"
+CALL_ENDED = "call_ended"
+
+# KEYS[1] sequence, KEYS[2] log (zset scored by seq); ARGV[1] JSON object with the
+# event fields, ARGV[2] log size. The frame is that object with type and seq prepended,
+# so the script does not depend on how the JSON encoder spaces its output.
+_APPEND_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+local frame = '{"type":"call_event","seq":' .. seq .. ',' .. string.sub(ARGV[1], 2)
+redis.call('ZADD', KEYS[2], seq, frame)
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+return {seq, frame}
+"""
+
+class CallEventLog:
+    """
+    Sequenced log of call list changes (added, claimed, ended) for admin tabs.
+    Each event gets a global sequence number and is kept in a capped Redis
+    sorted set, so a reconnecting tab can fetch only what it missed.
+    """
+
+    def __init__(self, redis_client: redis.Redis, size: int = CALL_EVENT_LOG_SIZE):
+        self.redis = redis_client
+        self.size = size
+        self.seq_key = "call_events:seq"
+        self.log_key = "call_events:log"
+        self.persisted_key = "call_events:persisted"
+        self._append = self.redis.register_script(_APPEND_SCRIPT)
+
+    async def append(self, event: str, call: Dict) -> Dict:
+        """Store an event and return its frame, ready to broadcast"""
+        fields = json.dumps({"event": event, "call": call})
+        seq, frame = await self._append(keys=[self.seq_key, self.log_key], args=[fields, self.size])
+        return json.loads(frame)
+
+    async def mark_persisted(self) -> int:
+        """
+        Count a write that changes list rows without an event (late durations
+        from the call journal). Kept apart from the sequence so tabs see no gap.
+        """
+        return await self.redis.incr(self.persisted_key)
+
+    async def versions(self) -> Tuple[int, int]:
+        """(sequence, persisted generation): together they version the call lists"""
+        seq, persisted = await self.redis.mget(self.seq_key, self.persisted_key)
+        return int(seq or 0), int(persisted or 0)
+
+    async def current_seq(self) -> int:
+        return int(await self.redis.get(self.seq_key) or 0)
+
+    async def since(self, last_seq: int) -> Optional[List[Dict]]:
+        """
+        Events after last_seq, oldest first. None if some of them were already
+        trimmed from the log, or if last_seq is ahead of the sequence (Redis
+        was flushed or failed over and it restarted), and the client has to
+        reload its lists.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrangebyscore(self.log_key, f"({last_seq}", "+inf")
+        pipe.zrange(self.log_key, 0, 0, withscores=True)
+        pipe.get(self.seq_key)
+        newer, oldest, seq = await pipe.execute()
+        seq = int(seq or 0)
+        if last_seq > seq:
+            return None
+        if oldest and last_seq < int(oldest[0][1]) - 1:
+            return None
+        if not oldest and last_seq < seq:
+            return None
+        return [json.loads(frame) for frame in newer]
@@ -0,0 +1,90 @@
+"""
+Write-behind journal for the non-critical call fields. The status change of
+a call is written on the request path (crud._transition_call); end_time and
+duration are queued here and stored in one executemany + commit once
+CALL_JOURNAL_BATCH entries are waiting or every CALL_JOURNAL_INTERVAL
+seconds. The queue is drained on shutdown; a crash loses at most the
+durations of the last interval, never a status. on_flush runs after each
+successful write (main passes CallEventLog.mark_persisted so list ETags change).
+"""
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from app import crud
+from app.models import CallSession
+
+logger = logging.getLogger("call_journal")
+
+CALL_JOURNAL_BATCH = int(os.getenv("CALL_JOURNAL_BATCH", "100"))
+CALL_JOURNAL_INTERVAL = float(os.getenv("CALL_JOURNAL_INTERVAL", "1"))
+# A failing DB keeps entries queued, beyond this the oldest are dropped
+CALL_JOURNAL_MAX = int(os.getenv("CALL_JOURNAL_MAX", "10000"))
+
+class CallJournal:
+    def __init__(self, batch_size: int = CALL_JOURNAL_BATCH, interval: float = CALL_JOURNAL_INTERVAL,
+                 max_size: int = CALL_JOURNAL_MAX, on_flush: Optional[Callable[[], Awaitable]] = None):
+        self.on_flush = on_flush
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.max_size = max_size
+        # session_id -> row for save_call_ends (dict keeps insertion order)
+        self._pending: Dict[str, Dict] = {}
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def record_end(self, call: CallSession):
+        """Queue end_time/duration of a call returned by crud.end_call"""
+        self._pending[call.session_id] = {"b_session_id": call.session_id, "b_end_time": call.end_time,
+                                          "b_duration": call.duration}
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the timer and write whatever is still queued"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        self._full.clear()
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, {}
+        try:
+            await crud.save_call_ends(list(rows.values()))
+        except Exception:
+            logger.exception("Failed to write %d call ends, keeping them queued", len(rows))
+            # Entries queued meanwhile are newer, keep them over the failed batch
+            rows.update(self._pending)
+            overflow = len(rows) - self.max_size
+            if overflow > 0:
+                for session_id in list(rows)[:overflow]:
+                    del rows[session_id]
+                self.dropped += overflow
+            self._pending = rows
+            return
+        if self.on_flush is not None:
+            try:
+                await self.on_flush()
+            except Exception:
+                logger.exception("Call journal flush callback failed")
@@ -0,0 +1,165 @@
+"""
+Signaling frame codecs. JSON goes through orjson when it is installed, and
+clients may negotiate msgpack (if installed) with the "signal.msgpack.v1"
+WebSocket subprotocol. Unsequenced frames that carry only a type are
+encoded once at import, other broadcasts once per codec (see
+SignalingHub.deliver); session frames carry a per-client signal_seq and are
+encoded per client. validate() checks inbound frames before any relay logic
+sees them.
+"""
+import json
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_SUBPROTOCOL = "signal.json.v1"
+MSGPACK_SUBPROTOCOL = "signal.msgpack.v1"
+
+# Upper bounds for inbound fields
+MAX_ID_LENGTH = 128
+MAX_SDP_LENGTH = 64 * 1024
+MAX_CANDIDATE_LENGTH = 4096
+
+class FrameError(ValueError):
+    """Inbound frame that cannot be decoded (kind="decode") or fails validation (kind="schema")"""
+
+    def __init__(self, detail: str, kind: str = "schema"):
+        super().__init__(detail)
+        self.kind = kind
+
+Encoded = Union[str, bytes]
+
+class Codec:
+    name = ""
+    subprotocol: Optional[str] = None
+
+    def __init__(self):
+        self._constants: Dict[str, Encoded] = {}
+
+    def dumps(self, frame: Any) -> Encoded:
+        raise NotImplementedError
+
+    def loads(self, data: Encoded) -> Any:
+        raise NotImplementedError
+
+    def encode(self, frame: Dict) -> Encoded:
+        """Wire form of a frame; type-only frames come from the pre-encoded table"""
+        if len(frame) == 1:
+            cached = self._constants.get(frame.get("type"))
+            if cached is not None:
+                return cached
+        return self.dumps(frame)
+
+    def decode(self, data: Encoded) -> Dict:
+        try:
+            frame = self.loads(data)
+        except Exception:
+            raise FrameError("undecodable", "decode")
+        if not isinstance(frame, dict):
+            raise FrameError("not an object", "decode")
+        return frame
+
+    def add_constant(self, frame_type: str):
+        self._constants[frame_type] = self.dumps({"type": frame_type})
+
+class JSONCodec(Codec):
+    name = "json"
+    subprotocol = JSON_SUBPROTOCOL
+
+    if orjson is not None:
+        def dumps(self, frame: Any) -> str:
+            return orjson.dumps(frame).decode()
+
+        def loads(self, data: Encoded) -> Any:
+            return orjson.loads(data)
+    else:
+        def dumps(self, frame: Any) -> str:
+            return json.dumps(frame, separators=(",", ":"))
+
+        def loads(self, data: Encoded) -> Any:
+            return json.loads(data)
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def dumps(self, frame: Any) -> bytes:
+        return msgpack.packb(frame)
+
+    def loads(self, data: Encoded) -> Any:
+        if isinstance(data, str):
+            # Text frames on a msgpack socket are still JSON
+            return JSON.loads(data)
+        return msgpack.unpackb(data)
+
+JSON = JSONCodec()
+MSGPACK = MsgpackCodec() if msgpack is not None else None
+
+_BY_SUBPROTOCOL = {codec.subprotocol: codec for codec in (JSON, MSGPACK) if codec is not None}
+
+# Type-only frames sent outside sessions (session frames such as call_ended get a signal_seq)
+CONSTANT_FRAME_TYPES = ("invalid_frame", "ping")
+for _codec in _BY_SUBPROTOCOL.values():
+    for _frame_type in CONSTANT_FRAME_TYPES:
+        _codec.add_constant(_frame_type)
+
+INVALID_FRAME = {"type": "invalid_frame"}
+
+def negotiate(subprotocols: List[str]) -> Codec:
+    """First supported subprotocol the client offered; plain JSON if none"""
+    for subprotocol in subprotocols:
+        codec = _BY_SUBPROTOCOL.get(subprotocol)
+        if codec is not None:
+            return codec
+    return JSON
+
+def dumps(value: Any) -> str:
+    """JSON text through the fast backend (Redis payloads, logs)"""
+    return JSON.dumps(value)
+
+def loads(data: Encoded) -> Any:
+    return JSON.loads(data)
+
+# Inbound schema: type -> {field: (types, required, max length)}
+_STR = (str,)
+_SCHEMAS: Dict[str, Dict[str, tuple]] = {
+    "join_session": {"session_id": (_STR, True, MAX_ID_LENGTH)},
+    "agent_ready": {"agent_id": (_STR, False, MAX_ID_LENGTH)},
+    "resync": {"last_seq": ((int,), False, None)},
+    # Heartbeat reply to the server's ping
+    "pong": {},
+    "offer": {"target": (_STR, True, MAX_ID_LENGTH), "sdp": (_STR, True, MAX_SDP_LENGTH)},
+    "answer": {"target": (_STR, True, MAX_ID_LENGTH), "sdp": (_STR, True, MAX_SDP_LENGTH)},
+    # candidate null = end of candidates
+    "ice_candidate": {"target": (_STR, True, MAX_ID_LENGTH), "candidate": ((dict, type(None)), True, None)},
+}
+
+def validate(frame: Dict) -> str:
+    """Return the frame type, raise FrameError if the frame does not match its schema"""
+    frame_type = frame.get("type")
+    schema = _SCHEMAS.get(frame_type) if isinstance(frame_type, str) else None
+    if schema is None:
+        raise FrameError("unknown type")
+    for field, (types, required, max_length) in schema.items():
+        value = frame.get(field)
+        if value is None and field not in frame:
+            if required:
+                raise FrameError(f"missing {field}")
+            continue
+        if not isinstance(value, types) or isinstance(value, bool):
+            raise FrameError(f"bad {field}")
+        if max_length is not None and len(value) > max_length:
+            raise FrameError(f"{field} too long")
+        if field == "candidate" and value is not None:
+            candidate = value.get("candidate")
+            if not isinstance(candidate, str) or len(candidate) > MAX_CANDIDATE_LENGTH:
+                raise FrameError("bad candidate")
+    return frame_type
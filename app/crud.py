@@ -0,0 +1,293 @@
+"""
+Async data access for the API. Every function runs its SQLModel session in the
+DB thread pool (app.db.run_db), so handlers can await queries without blocking
+the event loop and the WebSockets on it.
+"""
+import json
+import base64
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, delete, or_, update
+from sqlmodel import Session, select, func
+
+from app.db import engine, read_engine, run_db
+from app.models import CALL_TRANSITIONS, AdminUser, CallSession, Recording
+from app import auth
+
+# Calls
+
+class CallTransitionError(Exception):
+    """The call exists but its current status does not allow the transition"""
+
+    def __init__(self, status: str):
+        super().__init__(f"call is {status}")
+        self.status = status
+
+def _supports_update_returning(dialect) -> bool:
+    if hasattr(dialect, "update_returning"):  # SQLAlchemy 2.0
+        return dialect.update_returning
+    return getattr(dialect, "full_returning", False)
+
+UPDATE_RETURNING = _supports_update_returning(engine.dialect)
+
+_CALL_COLUMNS = list(CallSession.__table__.columns)
+
+def _create_call(session_id: str, caller_id: str, caller_name: str) -> CallSession:
+    # Every field is set client side, so the row needs no refresh after the insert
+    with Session(engine, expire_on_commit=False) as db:
+        call = CallSession(
+            session_id=session_id,
+            caller_id=caller_id,
+            caller_name=caller_name,
+            status="pending",
+            start_time=datetime.utcnow()
+        )
+        db.add(call)
+        db.commit()
+        return call
+
+async def create_call(session_id: str, caller_id: str, caller_name: str) -> CallSession:
+    return await run_db(_create_call, session_id, caller_id, caller_name)
+
+def _transition_call(session_id: str, status: str, **values) -> Optional[CallSession]:
+    """
+    Move a call to status with one conditional UPDATE (RETURNING the row where
+    the dialect supports it), so concurrent transitions cannot both win.
+    Returns None if the call does not exist, raises CallTransitionError if its
+    current status does not allow the move.
+    """
+    sources = [source for source, targets in CALL_TRANSITIONS.items() if status in targets]
+    statement = update(CallSession.__table__).where(
+        CallSession.session_id == session_id,
+        CallSession.status.in_(sources)
+    ).values(status=status, **values)
+    current = select(*_CALL_COLUMNS).where(CallSession.session_id == session_id)
+
+    with engine.begin() as conn:
+        if UPDATE_RETURNING:
+            row = conn.execute(statement.returning(*_CALL_COLUMNS)).first()
+        else:
+            # Same transaction, the write lock taken by the UPDATE covers the read
+            row = conn.execute(current).first() if conn.execute(statement).rowcount else None
+        if row is None:
+            found = conn.execute(select(CallSession.status).where(CallSession.session_id == session_id)).first()
+    if row is not None:
+        return CallSession(**row._mapping)
+    if found is None:
+        return None
+    raise CallTransitionError(found.status)
+
+def _respond_call(session_id: str, action: str, agent_id: Optional[str]) -> Optional[CallSession]:
+    if action == "accept":
+        return _transition_call(session_id, "accepted", agent_id=agent_id, accept_time=datetime.utcnow())
+    return _transition_call(session_id, "rejected")
+
+async def respond_call(session_id: str, action: str, agent_id: Optional[str]) -> Optional[CallSession]:
+    """
+    Mark a pending call accepted/rejected, returns None if it does not exist
+    and raises CallTransitionError if it is no longer pending.
+    """
+    return await run_db(_respond_call, session_id, action, agent_id)
+
+def _get_call_status(session_id: str) -> Optional[str]:
+    with Session(engine) as db:
+        return db.exec(select(CallSession.status).where(CallSession.session_id == session_id)).first()
+
+async def get_call_status(session_id: str) -> Optional[str]:
+    """Current status of a call, None if it does not exist"""
+    return await run_db(_get_call_status, session_id)
+
+async def end_call(session_id: str) -> Optional[CallSession]:
+    """
+    Mark a call ended, returns None if it does not exist and raises
+    CallTransitionError if it already ended. end_time and duration are filled
+    in on the returned object only: they reach the row through the write-behind
+    CallJournal (app.call_journal).
+    """
+    end_time = datetime.utcnow()
+    call = await run_db(_transition_call, session_id, "ended")
+    if call is not None:
+        call.end_time = end_time
+        call.duration = max(0, int((end_time - call.start_time).total_seconds()))
+    return call
+
+def _save_call_ends(rows: List[dict]):
+    statement = update(CallSession.__table__).where(
+        CallSession.session_id == bindparam("b_session_id")
+    ).values(end_time=bindparam("b_end_time"), duration=bindparam("b_duration"))
+    with engine.begin() as conn:
+        conn.execute(statement, rows)
+
+async def save_call_ends(rows: List[dict]):
+    """Store end_time/duration for a batch of ended calls in one executemany and one commit"""
+    await run_db(_save_call_ends, rows)
+
+def _count_accepted_since(since: datetime) -> int:
+    with Session(engine) as db:
+        statement = select(func.count()).select_from(CallSession).where(
+            CallSession.start_time >= since,
+            CallSession.status.in_(["accepted", "ended"]),
+            # Ended also covers missed and rejected calls; only accepts took a quota slot
+            or_(CallSession.accept_time.is_not(None), CallSession.agent_id.is_not(None))
+        )
+        return db.exec(statement).one()
+
+async def count_accepted_since(since: datetime) -> int:
+    """Calls started since `since` that were accepted (whatever their status now)"""
+    return await run_db(_count_accepted_since, since)
+
+def call_to_dict(c) -> dict:
+    """Public row payload for history lists and call events"""
+    return {"id": c.id, "session_id": c.session_id, "caller_name": c.caller_name, 
+            "status": c.status, "start_time": c.start_time.isoformat(), 
+            "duration": c.duration, "agent_id": c.agent_id}
+
+async def load_pending_calls() -> List[dict]:
+    """Every pending call as a payload dict (pending queue rebuild)"""
+    # Authoritative: a lagging replica could bring back calls already claimed or ended
+    rows = await page_calls(HISTORY_COLUMNS, PENDING_REBUILD_LIMIT, status="pending", primary=True)
+    return [call_to_dict(r) for r in rows]
+
+# Keyset pagination over (start_time, id), newest first
+
+HISTORY_COLUMNS = ("id", "session_id", "caller_name", "status", "start_time", "duration", "agent_id")
+PENDING_COLUMNS = ("id", "session_id", "caller_name", "start_time")
+PENDING_REBUILD_LIMIT = 10000
+
+def encode_cursor(start_time: datetime, call_id: int) -> str:
+    raw = f"{start_time.isoformat()}|{call_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        start_time, call_id = raw.split("|", 1)
+        return datetime.fromisoformat(start_time), int(call_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+def _page_calls(columns: Sequence[str], limit: int, before: Optional[str], after: Optional[str],
+                status: Optional[str], agent_id: Optional[str], primary: bool = False) -> list:
+    statement = select(*[getattr(CallSession, name) for name in columns])
+    if status is not None:
+        statement = statement.where(CallSession.status == status)
+    if agent_id is not None:
+        statement = statement.where(CallSession.agent_id == agent_id)
+
+    if after:
+        # Rows newer than the cursor: walk up the index, then flip to newest first
+        start_time, call_id = decode_cursor(after)
+        statement = statement.where(or_(
+            CallSession.start_time > start_time,
+            and_(CallSession.start_time == start_time, CallSession.id > call_id)
+        )).order_by(CallSession.start_time.asc(), CallSession.id.asc())
+    else:
+        if before:
+            start_time, call_id = decode_cursor(before)
+            statement = statement.where(or_(
+                CallSession.start_time < start_time,
+                and_(CallSession.start_time == start_time, CallSession.id < call_id)
+            ))
+        statement = statement.order_by(CallSession.start_time.desc(), CallSession.id.desc())
+
+    # Replica reads suit only lists not versioned by the call event seq
+    with Session(engine if primary else read_engine) as db:
+        rows = db.exec(statement.limit(limit)).all()
+    if after:
+        rows.reverse()
+    return rows
+
+async def page_calls(columns: Sequence[str], limit: int, before: Optional[str] = None,
+                     after: Optional[str] = None, status: Optional[str] = None,
+                     agent_id: Optional[str] = None, primary: bool = False) -> list:
+    """
+    One page of calls projected to the given columns (must include id and
+    start_time). before/after are cursors from encode_cursor. Reads go to
+    the read replica (if any) unless primary is set.
+    """
+    if before:
+        decode_cursor(before)
+    if after:
+        decode_cursor(after)
+    return await run_db(_page_calls, columns, limit, before, after, status, agent_id, primary)
+
+# Admin users
+
+def _get_admin(username: str) -> Optional[AdminUser]:
+    with Session(engine) as db:
+        return auth.get_admin_by_username(db, username)
+
+async def get_admin(username: str) -> Optional[AdminUser]:
+    return await run_db(_get_admin, username)
+
+def _ensure_admin(username: str, password: str) -> AdminUser:
+    with Session(engine) as db:
+        return auth.create_admin(db, username, password)
+
+async def ensure_admin(username: str, password: str) -> AdminUser:
+    """Create the admin user if missing (password hashing also stays off the loop)"""
+    return await run_db(_ensure_admin, username, password)
+
+# Recordings
+
+def _save_recording(session_id: str, role: str, file_path: str, size: int,
+                    tracks: Optional[str] = None) -> Recording:
+    with Session(engine) as db:
+        recording = Recording(session_id=session_id, role=role, file_path=file_path, size=size, tracks=tracks)
+        db.add(recording)
+        db.commit()
+        db.refresh(recording)
+        return recording
+
+async def save_recording(session_id: str, role: str, file_path: str, size: int,
+                         tracks: Optional[str] = None) -> Recording:
+    return await run_db(_save_recording, session_id, role, file_path, size, tracks)
+
+def _get_recording(recording_id: int) -> Optional[Recording]:
+    with Session(engine) as db:
+        return db.get(Recording, recording_id)
+
+async def get_recording(recording_id: int) -> Optional[Recording]:
+    return await run_db(_get_recording, recording_id)
+
+def _page_recordings(session_id: Optional[str], limit: int, before_id: Optional[int]) -> List[Recording]:
+    statement = select(Recording)
+    if session_id is not None:
+        statement = statement.where(Recording.session_id == session_id)
+    if before_id is not None:
+        statement = statement.where(Recording.id < before_id)
+    with Session(engine) as db:
+        return db.exec(statement.order_by(Recording.id.desc()).limit(limit)).all()
+
+async def page_recordings(session_id: Optional[str], limit: int, before_id: Optional[int] = None) -> List[Recording]:
+    """Recordings newest first, keyset on id (pass the last id of a page as before_id)"""
+    return await run_db(_page_recordings, session_id, limit, before_id)
+
+def recording_to_dict(r: Recording) -> dict:
+    return {"id": r.id, "session_id": r.session_id, "role": r.role, "size": r.size,
+            "tracks": json.loads(r.tracks) if r.tracks else None,
+            "created_at": r.created_at.isoformat()}
+
+def _recording_files(after_id: int, limit: int) -> List[Tuple[int, Optional[str]]]:
+    statement = select(Recording.id, Recording.file_path).where(Recording.id > after_id) \
+        .order_by(Recording.id.asc()).limit(limit)
+    with Session(engine) as db:
+        return [tuple(row) for row in db.exec(statement).all()]
+
+async def recording_files(after_id: int, limit: int) -> List[Tuple[int, Optional[str]]]:
+    """(id, file_path) of recordings with id > after_id, oldest first"""
+    return await run_db(_recording_files, after_id, limit)
+
+def _delete_recordings(ids: Sequence[int]) -> int:
+    with Session(engine) as db:
+        result = db.exec(delete(Recording).where(Recording.id.in_(ids)))
+        db.commit()
+        return result.rowcount
+
+async def delete_recordings(ids: Sequence[int]) -> int:
+    """Delete Recording rows in one statement, returns the number removed"""
+    if not ids:
+        return 0
+    return await run_db(_delete_recordings, list(ids))
@@ -1,16 +1,102 @@
 import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event, inspect, text
 from sqlmodel import SQLModel, create_engine, Session
 
+from app import metrics
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./database.db")
+# Optional read replica for crud.page_calls(primary=False); the admin call lists are
+# versioned by the call event seq and always read the primary. Empty = primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+
+# Dedicated threads for blocking DB calls so queries never run on the event loop
+DB_THREADS = int(os.getenv("DB_THREADS", "8"))
+
+# Server databases (Postgres): one pooled connection per DB thread by default
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(DB_THREADS)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# Seconds before a pooled connection is replaced (server/proxy idle timeouts)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite: WAL lets readers run during a write, busy_timeout waits for the
+# write lock instead of failing with "database is locked"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+def _sqlite_pragmas(url: str) -> list:
+    pragmas = [f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+               f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+               f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}"]
+    # journal_mode is per file; in-memory databases keep their own
+    if ":memory:" not in url and url.rstrip("/") not in ("sqlite:", "sqlite+pysqlite:"):
+        pragmas.insert(0, f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    return pragmas
+
+def make_engine(url: str):
+    """Engine with the environment's DB profile applied (SQLite pragmas or pool sizing)"""
+    if url.startswith("sqlite"):
+        # check_same_thread disabled: sessions are used from the DB thread pool
+        engine = create_engine(url, echo=False, connect_args={"check_same_thread": False})
+        pragmas = _sqlite_pragmas(url)
 
-# For sqlite ensure check_same_thread disabled for SQLModel + FastAPI simple usage
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
 
-engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
+        return engine
+    return create_engine(url, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                         pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=DB_POOL_PRE_PING,
+                         pool_recycle=DB_POOL_RECYCLE)
+
+engine = make_engine(DATABASE_URL)
+# Replica lag is fine for list views; lifecycle writes and quota counts stay on engine
+read_engine = make_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
 
 def init_db():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    # create_all skips existing tables, so add indexes introduced later explicitly
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def _add_missing_columns():
+    """create_all never alters existing tables: add nullable columns introduced later"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def run_db(fn, *args, **kwargs):
+    """Run a blocking DB function in the DB thread pool and await its result"""
+    loop = asyncio.get_running_loop()
+    with metrics.DB_LATENCY.time(fn.__name__.lstrip("_")):
+        return await loop.run_in_executor(_db_executor, functools.partial(fn, *args, **kwargs))
+
+def shutdown_db():
+    _db_executor.shutdown(wait=True)
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
@@ -0,0 +1,416 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from app import metrics
+from app.codec import Codec, Encoded, JSON
+
+logger = logging.getLogger("hub")
+
+CALLER = "caller"
+AGENT = "agent"
+
+# Outbound frames buffered per socket before the peer is treated as a slow consumer
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+# Seconds a single send may block before the peer is evicted
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+# Close code for evicted slow consumers ("try again later")
+EVICT_CLOSE_CODE = 1013
+# Seconds a dropped client keeps its sessions and may resume with ?last_seq= (0 = no resume)
+RESUME_GRACE = float(os.getenv("WS_RESUME_GRACE", "20"))
+# Session frames kept per client for replay; the whole replay must fit in the send queue
+REPLAY_BUFFER_SIZE = max(1, min(int(os.getenv("WS_REPLAY_BUFFER", "32")), SEND_QUEUE_SIZE - 2))
+# Heartbeat: sockets quiet for WS_PING_INTERVAL seconds get a ping (0 = no heartbeat),
+# and are reaped (then detached like a drop) after WS_IDLE_TIMEOUT seconds without any frame
+PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+# Sessions without any signaling for this long and without a connected or
+# resumable member on this process are dropped locally (0 = never)
+SESSION_IDLE_TIMEOUT = float(os.getenv("WS_SESSION_IDLE_TIMEOUT", "3600"))
+# Close code for reaped idle sockets ("going away")
+IDLE_CLOSE_CODE = 1001
+
+RESUME_FAILED = {"type": "resume_failed"}
+PING = {"type": "ping"}
+CALL_ENDED = {"type": "call_ended"}
+
+def role_of(client_id: str) -> str:
+    """Role is encoded in the client_id prefix (caller_..., agent_...)"""
+    prefix, _, _ = client_id.partition("_")
+    return prefix if prefix in (CALLER, AGENT) else ""
+
+class ClientConnection:
+    """
+    A socket with its own bounded outbound queue drained by a writer task,
+    so a stalled peer never blocks the sender or a broadcast.
+    """
+
+    def __init__(self, client_id: str, websocket: WebSocket,
+                 on_evict: Callable[["ClientConnection", str], None], codec: Codec = JSON):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.codec = codec
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.closed = False
+        self.last_seen = asyncio.get_running_loop().time()
+        self._close_sent = False
+        self._on_evict = on_evict
+        self._writer = asyncio.create_task(self._drain())
+
+    def touch(self):
+        """Any inbound frame (pong included) proves the peer is alive"""
+        self.last_seen = asyncio.get_running_loop().time()
+
+    def send_frame(self, frame: Dict) -> bool:
+        return self.send(self.codec.encode(frame))
+
+    def send(self, data: Encoded) -> bool:
+        """Queue an encoded frame without waiting, evicts the peer if its queue is full"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._evict("send queue overflow")
+            return False
+        return True
+
+    async def _drain(self):
+        try:
+            # close() sets closed before cancelling: wait_for on 3.11 can swallow a
+            # cancel that races a finished send, and the loop must still end
+            while not self.closed:
+                data = await self.queue.get()
+                if isinstance(data, bytes):
+                    await asyncio.wait_for(self.websocket.send_bytes(data), SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(self.websocket.send_text(data), SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._evict("send timeout")
+        except Exception:
+            self._evict("send failed")
+
+    def _evict(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        metrics.WS_SEND_FAILURES.inc(reason)
+        self._on_evict(self, reason)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self._close_sent:
+            return
+        self._close_sent = True
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), SEND_TIMEOUT)
+        except Exception:
+            pass
+
+class ClientState:
+    """
+    Resumable side of a client: every session frame it is sent gets the next
+    signal_seq and a copy in a bounded replay buffer, whether or not a socket
+    is attached at that moment.
+    """
+
+    def __init__(self, size: int = REPLAY_BUFFER_SIZE):
+        self.seq = 0
+        self.buffer: Deque[Dict] = deque(maxlen=size)
+        self.expiry: Optional[asyncio.TimerHandle] = None
+
+    def stamp(self, frame: Dict) -> Dict:
+        self.seq += 1
+        frame = dict(frame, signal_seq=self.seq)
+        self.buffer.append(frame)
+        return frame
+
+    def since(self, last_seq: int) -> Optional[List[Dict]]:
+        """Frames after last_seq, None if some of them already fell out of the buffer"""
+        if last_seq > self.seq or last_seq < 0:
+            return None
+        if last_seq < self.seq and (not self.buffer or self.buffer[0]["signal_seq"] > last_seq + 1):
+            return None
+        return [frame for frame in self.buffer if frame["signal_seq"] > last_seq]
+
+class SignalingHub:
+    """
+    Local socket registry with O(1) indexes:
+      client_id -> connection (socket + outbound queue)
+      client_id -> set of session_ids
+      session_id -> role -> set of client_ids
+      set of agent client_ids
+      client_id -> ClientState (sequence + replay buffer)
+    Joins, leaves, disconnects and peer lookups never scan other sessions.
+
+    A dropped socket is only detached: the client keeps its sessions and
+    buffers frames for RESUME_GRACE seconds, and a reconnect with last_seq
+    gets the missed frames replayed. After the grace period it is removed.
+
+    Cleanup never depends on the peer: the heartbeat pings quiet sockets and
+    reaps those that stay silent, a session is dropped on every worker when
+    its call_ended is delivered (or after SESSION_IDLE_TIMEOUT without
+    traffic once none of its members has a socket here), and a client
+    leaving for good sends call_ended to its peers.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.connections: Dict[str, ClientConnection] = {}
+        self.client_sessions: Dict[str, Set[str]] = {}
+        self.session_members: Dict[str, Dict[str, Set[str]]] = {}
+        self.agents: Set[str] = set()
+        self.states: Dict[str, ClientState] = {}
+        # session_id -> loop time of its last join or delivered frame
+        self.session_activity: Dict[str, float] = {}
+        self._evictions: Set[asyncio.Task] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if PING_INTERVAL > 0:
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            await asyncio.gather(self._heartbeat, return_exceptions=True)
+            self._heartbeat = None
+        await asyncio.gather(*self._evictions, return_exceptions=True)
+
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(PING_INTERVAL / 2)
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception("Signaling heartbeat failed")
+
+    async def heartbeat(self):
+        """Ping quiet sockets, reap silent ones and sessions nobody signals on"""
+        now = asyncio.get_running_loop().time()
+        for client_id, connection in list(self.connections.items()):
+            idle = now - connection.last_seen
+            if idle >= IDLE_TIMEOUT:
+                logger.info("Reaping idle client=%s (%.0fs silent)", client_id, idle)
+                metrics.WS_REAPED.inc("idle")
+                await connection.close(code=IDLE_CLOSE_CODE)
+                await self.detach(client_id, connection)
+            elif idle >= PING_INTERVAL:
+                connection.send_frame(PING)
+        if SESSION_IDLE_TIMEOUT > 0:
+            for session_id, last in list(self.session_activity.items()):
+                # A long call needs no signaling once media flows P2P: keep it while
+                # any member is still connected or within its resume grace
+                if now - last >= SESSION_IDLE_TIMEOUT and not self._has_live_member(session_id):
+                    logger.info("Dropping abandoned session=%s", session_id)
+                    metrics.WS_REAPED.inc("session")
+                    await self.drop_session(session_id)
+
+    def connect(self, client_id: str, websocket: WebSocket, codec: Codec = JSON,
+                last_seq: Optional[int] = None) -> ClientConnection:
+        """
+        Attach a socket. With last_seq (a reconnect) the frames the client missed
+        are replayed, followed by {"type": "resumed"}, or it gets
+        {"type": "resume_failed"} if they are gone and must start over.
+        """
+        connection = ClientConnection(client_id, websocket, self._schedule_evict, codec)
+        previous = self.connections.get(client_id)
+        if previous is not None:
+            self._schedule_evict(previous, "replaced by new connection")
+        self.connections[client_id] = connection
+        if role_of(client_id) == AGENT:
+            self.agents.add(client_id)
+
+        state = self.states.get(client_id)
+        replay = state.since(last_seq) if state is not None and last_seq is not None else None
+        if state is None:
+            state = self.states[client_id] = ClientState()
+        if state.expiry is not None:
+            state.expiry.cancel()
+            state.expiry = None
+        if last_seq is not None:
+            if replay is None:
+                connection.send_frame(RESUME_FAILED)
+            else:
+                for frame in replay:
+                    connection.send_frame(frame)
+                connection.send_frame({"type": "resumed", "signal_seq": state.seq, "replayed": len(replay)})
+        return connection
+
+    async def detach(self, client_id: str, connection: ClientConnection):
+        """Socket dropped: keep sessions and buffer frames for RESUME_GRACE seconds"""
+        if RESUME_GRACE <= 0:
+            await self.disconnect(client_id, connection)
+            return
+        await connection.close()
+        if self.connections.get(client_id) is not connection:
+            return
+        del self.connections[client_id]
+        self.agents.discard(client_id)
+        state = self.states.get(client_id)
+        if state is not None:
+            state.expiry = asyncio.get_running_loop().call_later(RESUME_GRACE, self._expire, client_id)
+
+    def _expire(self, client_id: str):
+        if client_id in self.connections:
+            return
+        logger.info("Client %s did not resume within %ss", client_id, RESUME_GRACE)
+        metrics.WS_REAPED.inc("resume_expired")
+        task = asyncio.create_task(self.disconnect(client_id))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def disconnect(self, client_id: str, connection: Optional[ClientConnection] = None) -> Set[str]:
+        """
+        Drop the socket and all its memberships, returns the sessions it was in
+        after telling the peers left in them that the call ended.
+        With connection given, nothing happens if client_id has since reconnected.
+        """
+        current = self.connections.get(client_id)
+        if connection is not None and current is not connection:
+            await connection.close()
+            return set()
+        self.connections.pop(client_id, None)
+        if current is not None:
+            await current.close()
+        self.agents.discard(client_id)
+        state = self.states.pop(client_id, None)
+        if state is not None and state.expiry is not None:
+            state.expiry.cancel()
+        sessions = self.client_sessions.pop(client_id, set())
+        for session_id in sessions:
+            await self._remove_member(session_id, client_id)
+        for session_id in sessions:
+            # Peers may be on other workers, so publish rather than look locally
+            try:
+                await self.backend.publish_session(session_id, CALL_ENDED, exclude=client_id)
+            except Exception:
+                logger.exception("Failed to publish call_ended session=%s", session_id)
+        return sessions
+
+    async def join(self, session_id: str, client_id: str):
+        members = self.session_members.get(session_id)
+        if members is None:
+            members = self.session_members[session_id] = {}
+            await self.backend.watch_session(session_id)
+        self.session_activity[session_id] = asyncio.get_running_loop().time()
+        members.setdefault(role_of(client_id), set()).add(client_id)
+        self.client_sessions.setdefault(client_id, set()).add(session_id)
+
+    async def leave(self, session_id: str, client_id: str):
+        sessions = self.client_sessions.get(client_id)
+        if sessions is not None:
+            sessions.discard(session_id)
+            if not sessions:
+                del self.client_sessions[client_id]
+        await self._remove_member(session_id, client_id)
+
+    async def _remove_member(self, session_id: str, client_id: str):
+        members = self.session_members.get(session_id)
+        if members is None:
+            return
+        role = role_of(client_id)
+        clients = members.get(role)
+        if clients is not None:
+            clients.discard(client_id)
+            if not clients:
+                del members[role]
+        if not members:
+            del self.session_members[session_id]
+            self.session_activity.pop(session_id, None)
+            await self.backend.unwatch_session(session_id)
+
+    def _has_live_member(self, session_id: str) -> bool:
+        return any(client_id in self.states for client_id in self.members(session_id))
+
+    async def drop_session(self, session_id: str):
+        """Forget a session on this process; its clients stay connected"""
+        members = self.session_members.pop(session_id, None)
+        self.session_activity.pop(session_id, None)
+        if members is None:
+            return
+        for clients in members.values():
+            for client_id in clients:
+                sessions = self.client_sessions.get(client_id)
+                if sessions is not None:
+                    sessions.discard(session_id)
+                    if not sessions:
+                        del self.client_sessions[client_id]
+        await self.backend.unwatch_session(session_id)
+
+    def members(self, session_id: str, role: Optional[str] = None) -> Iterable[str]:
+        """Clients of a session, optionally only one role"""
+        members = self.session_members.get(session_id)
+        if not members:
+            return ()
+        if role is not None:
+            return members.get(role, ())
+        return [client_id for clients in members.values() for client_id in clients]
+
+    def is_member(self, session_id: str, client_id: str) -> bool:
+        return session_id in self.client_sessions.get(client_id, ())
+
+    def _schedule_evict(self, connection: ClientConnection, reason: str):
+        logger.warning("Evicting client=%s: %s", connection.client_id, reason)
+        connection.closed = True
+        task = asyncio.create_task(self._evict(connection))
+        self._evictions.add(task)
+        task.add_done_callback(self._evictions.discard)
+
+    async def _evict(self, connection: ClientConnection):
+        await connection.close(code=EVICT_CLOSE_CODE)
+        if self.connections.get(connection.client_id) is connection:
+            # A slow consumer may come back and resume like any dropped socket
+            await self.detach(connection.client_id, connection)
+
+    async def deliver(self, envelope: Dict):
+        """Queue a signaling envelope on the matching sockets of this process"""
+        session_id = envelope.get("session_id")
+        role = envelope.get("role")
+        exclude = envelope.get("exclude")
+        if session_id is not None:
+            targets = self.members(session_id, role)
+        elif role == AGENT:
+            targets = self.agents
+        else:
+            targets = self.connections.keys()
+
+        frame = envelope["frame"]
+        # Unsequenced frames are encoded at most once per codec for the whole broadcast
+        encoded: Dict[str, Encoded] = {}
+        sent = 0
+        for client_id in list(targets):
+            if client_id == exclude:
+                continue
+            connection = self.connections.get(client_id)
+            if session_id is not None:
+                # Session frames are sequenced per client (and buffered while detached)
+                state = self.states.get(client_id)
+                if state is not None:
+                    stamped = state.stamp(frame)
+                    if connection is not None and connection.send_frame(stamped):
+                        sent += 1
+                    continue
+            if connection is None:
+                continue
+            data = encoded.get(connection.codec.name)
+            if data is None:
+                data = encoded[connection.codec.name] = connection.codec.encode(frame)
+            if connection.send(data):
+                sent += 1
+        if sent:
+            metrics.WS_FRAMES_SENT.inc(frame.get("type", ""), amount=sent)
+        if session_id is not None and session_id in self.session_members:
+            if frame.get("type") == "call_ended":
+                # Every worker watching the session gets this, so each drops it here
+                await self.drop_session(session_id)
+            else:
+                self.session_activity[session_id] = asyncio.get_running_loop().time()
@@ -0,0 +1,66 @@
+"""
+ICE candidate relay. With ICE_BATCH_WINDOW_MS > 0 candidates from one sender
+in one session are held for that many milliseconds and go out as a single
+{"type": "ice_candidates", "candidates": [...]} frame; a null candidate
+(end of candidates) flushes the batch at once. With 0 every candidate is
+relayed on its own as {"type": "ice_candidate", "candidate": ...}.
+"""
+import os
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("ice_relay")
+
+ICE_BATCH_WINDOW_MS = float(os.getenv("ICE_BATCH_WINDOW_MS", "0"))
+
+class IceRelay:
+    def __init__(self, backend, window_ms: float = ICE_BATCH_WINDOW_MS):
+        self.backend = backend
+        self.window = window_ms / 1000
+        # (session_id, sender) -> candidates waiting for the window to close
+        self._batches: Dict[Tuple[str, str], List[Dict]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def relay(self, session_id: str, sender: str, candidate: Optional[Dict]):
+        if self.window <= 0:
+            if candidate is not None:
+                await self.backend.publish_session(session_id, {"type": "ice_candidate", "candidate": candidate},
+                                                   exclude=sender)
+            return
+
+        key = (session_id, sender)
+        if candidate is None:
+            await self.flush(key)
+            return
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._schedule_flush, key)
+        batch.append(candidate)
+
+    def _schedule_flush(self, key: Tuple[str, str]):
+        task = asyncio.create_task(self.flush(key))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def flush(self, key: Tuple[str, str]):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(key, None)
+        if not batch:
+            return
+        session_id, sender = key
+        try:
+            await self.backend.publish_session(session_id, {"type": "ice_candidates", "candidates": batch},
+                                               exclude=sender)
+        except Exception:
+            logger.exception("Failed to relay ICE batch session=%s", session_id)
+
+    async def stop(self):
+        """Send whatever is still batched"""
+        for key in list(self._batches):
+            await self.flush(key)
+        await asyncio.gather(*self._flushes, return_exceptions=True)
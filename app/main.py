@@ -1,22 +1,35 @@
 import os
-from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, Response, HTTPException, WebSocket, WebSocketDisconnect, Depends
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 import asyncio
-import json
+import time
+import hashlib
 import logging
-from typing import Dict, Set
+from typing import Optional, Set
+from datetime import datetime
 from contextlib import asynccontextmanager
 
-# from app.webrtc_handler import handle_record_offer, stop_recording as webrtc_stop_recording
-from app.telegram_bot import send_call_notification, send_otp, generate_otp
+from app.recording_pool import RecordingWorkerPool, RecordingCapacityError, RECORDING_ENABLED, SESSION_ROLE
+from app.telegram_bot import outbox as telegram_outbox, queue_call_notification, send_otp, generate_otp
 from app.otp_store import OTPStore
-from app.models import CallSession
-from app.db import init_db, engine
-from app.auth import get_admin_by_username, create_access_token
-from sqlmodel import Session, select
-from datetime import datetime
+from app.db import init_db, run_db, shutdown_db
+from app.auth import create_access_token, TokenAuth
+from app import crud
+from app.quota import CallQuota
+from app.ratelimit import (RateLimiter, SocketRateLimit, match_policy, client_ip, RATE_LIMIT_ENABLED,
+                           NOTIFY_POLICY)
+from app.pending_queue import PendingQueue
+from app.call_events import CallEventLog, CALL_ADDED, CALL_CLAIMED, CALL_ENDED
+from app.signaling import create_signaling_backend
+from app.hub import SignalingHub, CALLER, AGENT, role_of
+from app.media import RangeFileResponse, resolve_recording_path
+from app.retention import RetentionSweeper, RETENTION_ENABLED
+from app import metrics
+from app.codec import FrameError, INVALID_FRAME, negotiate, validate
+from app.ice_relay import IceRelay
+from app.call_journal import CallJournal
 import redis.asyncio as redis
 
 # Redis client
@@ -28,27 +41,126 @@ redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
 # OTP Store
 otp_store = OTPStore(redis_client)
 
-# WebSocket connections
-active_connections: Dict[str, WebSocket] = {}
-session_connections: Dict[str, Set[str]] = {}  # session_id -> set of client_ids
+# Recording engine in worker processes (RECORDING_ENABLED=1, needs aiortc + ffmpeg)
+recording_pool = RecordingWorkerPool() if RECORDING_ENABLED else None
+
+# Recording retention: max age / max total bytes, orphan reconciliation
+retention = RetentionSweeper(redis_client) if RETENTION_ENABLED else None
+
+# Bearer token auth with cached verification and Redis revocations
+token_auth = TokenAuth(redis_client, crud.get_admin)
+require_admin = token_auth.require_admin
+
+# Token-bucket rate limits for HTTP routes (see ROUTE_POLICIES)
+rate_limiter = RateLimiter(redis_client)
+
+# Daily call quota (CALL_QUOTA_LIMIT calls per CALL_QUOTA_WINDOW seconds)
+call_quota = CallQuota(redis_client)
+
+# Pending calls in arrival order with atomic claim (rebuilt from the DB when missing)
+pending_queue = PendingQueue(redis_client, crud.load_pending_calls)
+
+# Sequenced call list deltas pushed to admin tabs
+call_events = CallEventLog(redis_client)
+
+# Signaling bus (local or Redis pub/sub, see SIGNALING_BACKEND)
+signaling = create_signaling_backend(redis_client)
+
+# WebSocket connections and session membership of this process
+hub = SignalingHub(signaling)
+
+# ICE candidates, optionally coalesced per sender (ICE_BATCH_WINDOW_MS)
+ice_relay = IceRelay(signaling)
+
+# Write-behind end_time/duration of ended calls
+call_journal = CallJournal(on_flush=call_events.mark_persisted)
 
 logger = logging.getLogger("main")
 
+# Work started by handlers without awaiting it: referenced until done so it is
+# not garbage collected midway, and drained on shutdown
+background_tasks: Set[asyncio.Task] = set()
+
+def _background_done(task: asyncio.Task):
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task failed", exc_info=task.exception())
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(_background_done)
+    return task
+
+# Upper bound for ?limit= on the call list endpoints
+MAX_PAGE_SIZE = 500
+
+# Bearer token required on /metrics when set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Gauges mirroring live state, refreshed when /metrics is scraped
+async def collect_metrics():
+    roles = {CALLER: 0, AGENT: 0, "": 0}
+    for client_id in hub.connections:
+        roles[role_of(client_id)] += 1
+    for role, count in roles.items():
+        metrics.WS_CONNECTIONS.set(count, role or "other")
+    metrics.WS_SESSIONS.set(len(hub.session_members))
+    metrics.WS_DETACHED.set(len(hub.states) - len(hub.connections))
+    metrics.PENDING_CALLS.set(await pending_queue.count())
+    metrics.RECORDINGS_ACTIVE.set(recording_pool.active if recording_pool else 0)
+    metrics.TELEGRAM_QUEUE.set(telegram_outbox.depth)
+    metrics.CALL_JOURNAL_QUEUE.set(call_journal.depth)
+
+metrics.add_collector(collect_metrics)
+
 # Lifespan event
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    init_db()
+    await run_db(init_db)
     # Seed admin user
-    from app.auth import create_admin
-    with Session(engine) as session:
-        create_admin(session, os.getenv("ADMIN_USER", "admin"), os.getenv("ADMIN_PASS", "adminpass"))
+    await crud.ensure_admin(os.getenv("ADMIN_USER", "admin"), os.getenv("ADMIN_PASS", "adminpass"))
+    await signaling.start(hub.deliver)
+    await hub.start()
+    await call_journal.start()
+    await telegram_outbox.start()
+    if recording_pool:
+        await recording_pool.start()
+    if retention:
+        await retention.start()
     yield
     # Shutdown
-    pass
+    if retention:
+        await retention.stop()
+    await ice_relay.stop()
+    await hub.stop()
+    await signaling.stop()
+    await telegram_outbox.stop()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    if recording_pool:
+        await recording_pool.stop()
+    await call_journal.stop()
+    shutdown_db()
 
 app = FastAPI(lifespan=lifespan)
 
+# Rate limiting middleware; registered first so it is the innermost one and
+# 429 responses still get the CORS and security headers
+@app.middleware("http")
+async def rate_limit(request: Request, call_next):
+    policy = match_policy(request.url.path) if RATE_LIMIT_ENABLED else None
+    if policy is None:
+        return await call_next(request)
+    identity = request.url.path if policy.key == "route" else client_ip(request.headers, request.client)
+    decision = await rate_limiter.hit(policy, identity)
+    if not decision.allowed:
+        return JSONResponse(status_code=429, content={"detail": "Too many requests"},
+                            headers=decision.headers())
+    response = await call_next(request)
+    response.headers.update(decision.headers())
+    return response
+
 # CORS - Production: restrict origins
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 app.add_middleware(
@@ -57,6 +169,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "X-Event-Seq", "ETag", "Last-Modified",
+                    "Accept-Ranges", "Content-Range",
+                    "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset", "Retry-After"],
 )
 
 # Security headers middleware
@@ -69,21 +184,34 @@ async def add_security_headers(request: Request, call_next):
     response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
     return response
 
+# Latency per route template; registered last so it is the outermost middleware
+# and also sees requests answered by rate_limit
+@app.middleware("http")
+async def http_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        if route is not None:
+            path = route.path
+        else:
+            path = "/static" if request.url.path.startswith("/static/") else "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, request.method, path, status)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(req: Request):
+    """Prometheus text exposition"""
+    if METRICS_TOKEN and req.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(await metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Daily call limit check
-async def check_daily_limit() -> bool:
-    """Check if daily call limit (10) is exceeded"""
-    today = datetime.utcnow().date()
-    with Session(engine) as db:
-        statement = select(CallSession).where(
-            CallSession.start_time >= today,
-            CallSession.status.in_(["accepted", "ended"])
-        )
-        today_calls = db.exec(statement).all()
-        return len(today_calls) < 10
-
 # Request OTP endpoint with rate limiting
 @app.post("/api/auth/request-otp")
 async def request_otp(req: Request):
@@ -93,17 +221,12 @@ async def request_otp(req: Request):
         raise HTTPException(status_code=400, detail="username required")
 
     # Rate limiting: 3 attempts per minute per username
-    rate_key = f"otp_rate:{username}"
-    attempts = await redis_client.incr(rate_key)
-    if attempts == 1:
-        await redis_client.expire(rate_key, 60)  # 1 minute
-    if attempts > 3:
+    if not await otp_store.allow_request(username, limit=3, window=60):
         raise HTTPException(status_code=429, detail="Too many OTP requests. Try again later.")
 
-    with Session(engine) as session:
-        user = get_admin_by_username(session, username)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    user = await crud.get_admin(username)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
     otp = generate_otp()
     await otp_store.set_otp(username, otp)
@@ -123,14 +246,29 @@ async def verify_otp(req: Request):
     if not valid:
         raise HTTPException(status_code=401, detail="Invalid or expired OTP")
 
-    with Session(engine) as session:
-        user = get_admin_by_username(session, username)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        token = create_access_token(user.username)
+    user = await crud.get_admin(username)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    token = create_access_token(user.username)
 
     return {"access_token": token, "token_type": "bearer"}
 
+# Logout: revoke the bearer token on every worker
+@app.post("/api/auth/logout")
+async def logout(req: Request, username: str = Depends(require_admin)):
+    _, _, token = req.headers.get("authorization", "").partition(" ")
+    if token:
+        await token_auth.revoke(token)
+    return {"ok": True}
+
+# Route-level limit for policies keyed by a client id from the request body
+async def enforce_client_limit(policy, client_id: str):
+    if not RATE_LIMIT_ENABLED:
+        return
+    decision = await rate_limiter.hit(policy, client_id)
+    if not decision.allowed:
+        raise HTTPException(status_code=429, detail="Too many requests", headers=decision.headers())
+
 # Call notification endpoint
 @app.post("/api/call/notify")
 async def notify_call(req: Request):
@@ -141,39 +279,26 @@ async def notify_call(req: Request):
     
     if not caller_id or not session_id:
         raise HTTPException(status_code=400, detail="caller_id and session_id required")
+    await enforce_client_limit(NOTIFY_POLICY, caller_id)
     
     # Add caller to session
-    add_client_to_session(session_id, caller_id)
+    await hub.join(session_id, caller_id)
     
-    # Save to DB
-    with Session(engine) as db:
-        call = CallSession(
-            session_id=session_id,
-            caller_id=caller_id,
-            caller_name=caller_name,
-            status="pending"
-        )
-        db.add(call)
-        db.commit()
+    # Save to DB and queue it for agents
+    call = await crud.create_call(session_id, caller_id, caller_name)
+    await pending_queue.add(crud.call_to_dict(call))
     
-    # Send Telegram notification
-    await send_call_notification(caller_name)
+    # Send Telegram notification (background outbox, does not delay the response)
+    queue_call_notification(caller_name)
     
-    # Broadcast pending_update to all admin clients
-    for client_id, ws_conn in active_connections.items():
-        if client_id.startswith("agent_"):
-            try:
-                await ws_conn.send_text(json.dumps({
-                    "type": "pending_update"
-                }))
-            except Exception:
-                pass
+    # Push the new pending call to all admin clients
+    await publish_call_event(CALL_ADDED, call)
     
     return {"ok": True}
 
 # Accept/Reject call endpoint
 @app.post("/api/call/respond")
-async def respond_call(req: Request):
+async def respond_call(req: Request, username: str = Depends(require_admin)):
     data = await req.json()
     session_id = data.get("session_id")
     action = data.get("action")  # "accept" or "reject"
@@ -182,25 +307,40 @@ async def respond_call(req: Request):
     if not session_id or action not in ["accept", "reject"]:
         raise HTTPException(status_code=400, detail="Invalid request")
     
-    # Check daily limit for accept action
-    if action == "accept":
-        limit_ok = await check_daily_limit()
-        if not limit_ok:
-            raise HTTPException(status_code=429, detail="Daily call limit exceeded (10 calls)")
-    
-    with Session(engine) as db:
-        statement = select(CallSession).where(CallSession.session_id == session_id)
-        call = db.exec(statement).first()
-        if not call:
+    # Atomic claim: exactly one agent gets past this for a pending call
+    claimed = await pending_queue.claim(session_id)
+    if claimed is None:
+        # Only the miss path pays for the lookup: unknown calls stay 404
+        if await crud.get_call_status(session_id) is None:
             raise HTTPException(status_code=404, detail="Call not found")
-        
-        call.status = "accepted" if action == "accept" else "rejected"
+        raise HTTPException(status_code=409, detail="Call is not pending")
+
+    # Reserve a daily quota slot for accept action; on failure the call goes
+    # back to the queue and the slot is released
+    reservation = None
+    try:
         if action == "accept":
-            call.agent_id = agent_id
-            # Add agent to session
-            add_client_to_session(session_id, agent_id)
-        db.add(call)
-        db.commit()
+            reservation = await call_quota.reserve()
+            if reservation is None:
+                raise HTTPException(status_code=429, detail=f"Daily call limit exceeded ({call_quota.limit} calls)")
+        try:
+            call = await crud.respond_call(session_id, action, agent_id)
+        except crud.CallTransitionError as e:
+            raise HTTPException(status_code=409, detail=f"Call is {e.status}")
+        if not call:
+            raise HTTPException(status_code=404, detail="Call not found")
+    except Exception as e:
+        if reservation is not None:
+            await call_quota.release(reservation)
+        if not (isinstance(e, HTTPException) and e.status_code in (404, 409)):
+            await pending_queue.add(claimed)
+        raise
+
+    if action == "accept" and agent_id:
+        # Add agent to session
+        await hub.join(session_id, agent_id)
+
+    await publish_call_event(CALL_CLAIMED, call)
     
     return {"ok": True, "action": action}
 
@@ -213,151 +353,280 @@ async def end_call(req: Request):
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id required")
 
-    with Session(engine) as db:
-        statement = select(CallSession).where(CallSession.session_id == session_id)
-        call = db.exec(statement).first()
-        if not call:
-            raise HTTPException(status_code=404, detail="Call not found")
-
-        call.status = "ended"
-        call.end_time = datetime.utcnow()
-        if call.start_time:
-            call.duration = int((call.end_time - call.start_time).total_seconds())
-        db.add(call)
-        db.commit()
+    try:
+        call = await crud.end_call(session_id)
+    except crud.CallTransitionError:
+        raise HTTPException(status_code=409, detail="Call already ended")
+    if not call:
+        raise HTTPException(status_code=404, detail="Call not found")
+    call_journal.record_end(call)
+    # Caller hung up before anyone answered
+    await pending_queue.remove(session_id)
+    # Close the per-call recording whoever hung up, without holding the response
+    if recording_pool:
+        spawn(stop_session_recording(session_id))
 
     # Broadcast call_ended to other clients in session
-    if session_id in session_connections:
-        for other_client in session_connections[session_id]:
-            if other_client in active_connections:
-                try:
-                    await active_connections[other_client].send_text(json.dumps({
-                        "type": "call_ended"
-                    }))
-                except Exception:
-                    pass
+    await signaling.publish_session(session_id, {"type": "call_ended"})
+    await publish_call_event(CALL_ENDED, call)
 
     return {"ok": True}
 
 # Get call history
 @app.get("/api/calls/history")
-async def get_call_history(req: Request, limit: int = 50):
-    with Session(engine) as db:
-        statement = select(CallSession).order_by(CallSession.start_time.desc()).limit(limit)
-        calls = db.exec(statement).all()
-        return [{"id": c.id, "session_id": c.session_id, "caller_name": c.caller_name, 
-                 "status": c.status, "start_time": c.start_time.isoformat(), 
-                 "duration": c.duration, "agent_id": c.agent_id} for c in calls]
+async def get_call_history(req: Request, response: Response, limit: int = 50,
+                           before: Optional[str] = None, after: Optional[str] = None,
+                           status: Optional[str] = None, agent_id: Optional[str] = None,
+                           username: str = Depends(require_admin)):
+    if await check_not_modified(req, response):
+        return Response(status_code=304, headers={"ETag": response.headers["ETag"]})
+    calls = await fetch_call_page(response, crud.HISTORY_COLUMNS, limit, before, after, status, agent_id)
+    return [crud.call_to_dict(c) for c in calls]
 
 # Get pending calls
 @app.get("/api/calls/pending")
-async def get_pending_calls(req: Request):
-    with Session(engine) as db:
-        statement = select(CallSession).where(CallSession.status == "pending").order_by(CallSession.start_time.desc())
-        calls = db.exec(statement).all()
-        return [{"id": c.id, "session_id": c.session_id, "caller_name": c.caller_name, 
-                 "start_time": c.start_time.isoformat()} for c in calls]
+async def get_pending_calls(req: Request, response: Response, limit: int = 100,
+                            before: Optional[str] = None, after: Optional[str] = None,
+                            agent_id: Optional[str] = None, username: str = Depends(require_admin)):
+    if await check_not_modified(req, response):
+        return Response(status_code=304, headers={"ETag": response.headers["ETag"]})
+    if not (before or after or agent_id):
+        # First page straight from the Redis pending queue, cursors as in fetch_call_page
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        calls = await pending_queue.list(limit)
+        if calls:
+            first, last = calls[0], calls[-1]
+            response.headers["X-Prev-Cursor"] = crud.encode_cursor(
+                datetime.fromisoformat(first["start_time"]), first["id"])
+            if len(calls) == limit:
+                response.headers["X-Next-Cursor"] = crud.encode_cursor(
+                    datetime.fromisoformat(last["start_time"]), last["id"])
+        return [{"id": c["id"], "session_id": c["session_id"], "caller_name": c["caller_name"],
+                 "start_time": c["start_time"]} for c in calls]
+    calls = await fetch_call_page(response, crud.PENDING_COLUMNS, limit, before, after, "pending", agent_id)
+    return [{"id": c.id, "session_id": c.session_id, "caller_name": c.caller_name, 
+             "start_time": c.start_time.isoformat()} for c in calls]
+
+# Keyset page of calls; cursors for the neighbouring pages go in X-Next-Cursor/X-Prev-Cursor.
+# Read from the primary: the page is versioned by the current event seq (ETag, X-Event-Seq),
+# and a lagging replica would pin a body missing events up to that seq.
+async def fetch_call_page(response: Response, columns, limit, before, after, status, agent_id):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    try:
+        calls = await crud.page_calls(columns, limit, before, after, status, agent_id, primary=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if calls:
+        # X-Next-Cursor: older rows (?before=), X-Prev-Cursor: newer rows (?after=)
+        response.headers["X-Prev-Cursor"] = crud.encode_cursor(calls[0].start_time, calls[0].id)
+        if len(calls) == limit:
+            response.headers["X-Next-Cursor"] = crud.encode_cursor(calls[-1].start_time, calls[-1].id)
+    return calls
+
+# Every call list change goes through call_events, so its sequence number versions the
+# lists; durations written later by the call journal bump a separate generation.
+# ETag = seq + generation + request URL. Returns True if If-None-Match still matches.
+async def check_not_modified(req: Request, response: Response) -> bool:
+    seq, persisted = await call_events.versions()
+    url_hash = hashlib.md5(str(req.url).encode()).hexdigest()[:12]
+    etag = f'W/"{seq}.{persisted}-{url_hash}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Event-Seq"] = str(seq)
+    if_none_match = req.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+# Log a call list delta and push it to all admin clients
+async def publish_call_event(event: str, call):
+    try:
+        frame = await call_events.append(event, crud.call_to_dict(call))
+    except Exception:
+        logger.exception("Failed to record call event %s", event)
+        return
+    await signaling.publish_agents(frame)
 
 @app.post("/api/record/offer")
-async def record_offer_endpoint(req: Request):
-    """Recording disabled on Render free plan (no FFmpeg)"""
-    return {"sdp": "", "type": "answer", "disabled": True}
+async def record_offer_endpoint(req: Request, username: str = Depends(require_admin)):
+    """Hand the recording offer to a worker process, disabled unless RECORDING_ENABLED=1"""
+    if not recording_pool:
+        return {"sdp": "", "type": "answer", "disabled": True}
+    data = await req.json()
+    sdp = data.get("sdp")
+    role = data.get("role")
+    if not sdp or role not in [CALLER, AGENT, SESSION_ROLE]:
+        raise HTTPException(status_code=400, detail="sdp and role required")
+    # role=session: both legs in one peer connection, "tracks" maps mid -> caller/agent
+    track_roles = data.get("tracks") if role == SESSION_ROLE else None
+    try:
+        return await recording_pool.start_recording(sdp, data.get("type", "offer"), data.get("session_id"),
+                                                    role, track_roles)
+    except RecordingCapacityError:
+        raise HTTPException(status_code=503, detail="Recording capacity exhausted")
+    except Exception:
+        logger.exception("Recording offer failed")
+        raise HTTPException(status_code=502, detail="Recording worker failed")
 
 @app.post("/api/record/stop")
-async def record_stop_endpoint(req: Request):
-    """Recording disabled on Render free plan (no FFmpeg)"""
-    return {"ok": False, "msg": "recording disabled"}
+async def record_stop_endpoint(req: Request, username: str = Depends(require_admin)):
+    """Stop a recording in its worker process"""
+    if not recording_pool:
+        return {"ok": False, "msg": "recording disabled"}
+    data = await req.json()
+    try:
+        result = await recording_pool.stop_recording(data.get("session_id"), data.get("role"))
+    except Exception:
+        logger.exception("Recording stop failed")
+        raise HTTPException(status_code=502, detail="Recording worker failed")
+    return {"ok": result is not None, "recording": result}
+
+@app.get("/api/record/stats")
+async def record_stats_endpoint(username: str = Depends(require_admin)):
+    """Live recorders per worker with their memory and file descriptor use"""
+    if not recording_pool:
+        return {"enabled": False}
+    return dict(await recording_pool.stats(), enabled=True)
+
+# Recording list, newest first; ?before=<X-Next-Cursor> fetches the next page
+@app.get("/api/recordings")
+async def list_recordings(response: Response, session_id: Optional[str] = None, limit: int = 50,
+                          before: Optional[int] = None, username: str = Depends(require_admin)):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    recordings = await crud.page_recordings(session_id, limit, before)
+    if len(recordings) == limit:
+        response.headers["X-Next-Cursor"] = str(recordings[-1].id)
+    return [crud.recording_to_dict(r) for r in recordings]
+
+# Recording download: Range (seek in the player), ETag/Last-Modified revalidation
+@app.get("/api/recordings/{recording_id}")
+async def download_recording(req: Request, recording_id: int,
+                             username: str = Depends(token_auth.require_admin_media)):
+    recording = await crud.get_recording(recording_id)
+    path = resolve_recording_path(recording.file_path) if recording else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return RangeFileResponse(path, req.headers, filename=os.path.basename(path))
 
 # WebSocket endpoint for signaling
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await websocket.accept()
-    active_connections[client_id] = websocket
+    # Agent sockets must present an admin token (?token=); callers stay anonymous.
+    # Accepted before closing: a handshake rejected outright reaches the browser as
+    # 1006, and admin tabs need 1008 to stop reconnecting and go back to login.
+    if role_of(client_id) == AGENT and await token_auth.websocket_admin(websocket) is None:
+        await websocket.accept()
+        await websocket.close(code=1008)
+        return
+    # Wire encoding from the offered subprotocols (signal.msgpack.v1 / signal.json.v1), JSON by default
+    codec = negotiate(websocket.scope.get("subprotocols", []))
+    offered = codec.subprotocol in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=codec.subprotocol if offered else None)
+    # Reconnect after a drop: ?last_seq=<last signal_seq seen> resumes the session
+    try:
+        last_seq = int(websocket.query_params["last_seq"])
+    except (KeyError, ValueError):
+        last_seq = None
+    connection = hub.connect(client_id, websocket, codec, last_seq)
+    socket_limit = SocketRateLimit()
 
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
-
-            msg_type = message.get("type")
+            received = await websocket.receive()
+            if received["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(received.get("code", 1000))
+            data = received.get("text")
+            if data is None:
+                data = received.get("bytes")
+            connection.touch()
+            if not socket_limit.allow():
+                # Over the per-socket frame budget: drop, close on a sustained flood
+                metrics.WS_FRAMES_DROPPED.inc()
+                if socket_limit.exceeded:
+                    logger.warning("Closing flooding socket client=%s", client_id)
+                    await connection.close(code=1008)
+                    await hub.disconnect(client_id, connection)
+                    break
+                continue
+            try:
+                message = codec.decode(data)
+                msg_type = validate(message)
+            except FrameError as e:
+                logger.debug("Rejected frame from client=%s: %s", client_id, e)
+                metrics.WS_FRAMES_REJECTED.inc(e.kind)
+                connection.send_frame(INVALID_FRAME)
+                continue
+            metrics.WS_FRAMES_RECEIVED.inc(msg_type)
             
-            if msg_type == "join_session":
+            if msg_type == "pong":
+                continue
+
+            elif msg_type == "join_session":
                 # Add client to session
                 session_id = message.get("session_id")
                 if session_id:
-                    add_client_to_session(session_id, client_id)
+                    await hub.join(session_id, client_id)
 
+            elif msg_type == "resync":
+                # Admin tab asking for call list deltas after last_seq
+                await send_call_events(connection, message.get("last_seq", 0))
+
+            # Relays go through the signaling bus so the peer may live on another
+            # worker; the sender joins the target session so replies reach it too.
             elif msg_type == "offer":
                 # Agent sending offer to caller
                 target_session = message.get("target")
-                if target_session and target_session in session_connections:
-                    # Find caller in session
-                    for conn_id in session_connections[target_session]:
-                        if conn_id.startswith("caller_"):
-                            if conn_id in active_connections:
-                                await active_connections[conn_id].send_text(json.dumps({
-                                    "type": "offer",
-                                    "sdp": message["sdp"]
-                                }))
-                            break
+                if target_session:
+                    await hub.join(target_session, client_id)
+                    await signaling.publish_session(target_session, {
+                        "type": "offer",
+                        "sdp": message["sdp"]
+                    }, role=CALLER)
 
             elif msg_type == "answer":
                 # Caller sending answer to agent
                 target_session = message.get("target")
-                if target_session and target_session in session_connections:
-                    # Find agent in session
-                    for conn_id in session_connections[target_session]:
-                        if conn_id.startswith("agent_"):
-                            if conn_id in active_connections:
-                                await active_connections[conn_id].send_text(json.dumps({
-                                    "type": "answer",
-                                    "sdp": message["sdp"]
-                                }))
-                            break
+                if target_session:
+                    await hub.join(target_session, client_id)
+                    await signaling.publish_session(target_session, {
+                        "type": "answer",
+                        "sdp": message["sdp"]
+                    }, role=AGENT)
 
             elif msg_type == "ice_candidate":
-                # Forward ICE candidates
+                # Forward ICE candidates to all other clients in session (batched
+                # per sender when ICE_BATCH_WINDOW_MS is set, null flushes the batch)
                 target_session = message.get("target")
-                if target_session and target_session in session_connections:
-                    # Send to all other clients in session
-                    for conn_id in session_connections[target_session]:
-                        if conn_id != client_id and conn_id in active_connections:
-                            await active_connections[conn_id].send_text(json.dumps({
-                                "type": "ice_candidate",
-                                "candidate": message["candidate"]
-                            }))
+                if target_session:
+                    await hub.join(target_session, client_id)
+                    await ice_relay.relay(target_session, client_id, message["candidate"])
 
     except WebSocketDisconnect:
-        # Remove from active connections
-        if client_id in active_connections:
-            del active_connections[client_id]
-
-        # Remove from session connections
-        for session_id, clients in session_connections.items():
-            if client_id in clients:
-                clients.remove(client_id)
-                if not clients:
-                    del session_connections[session_id]
-                break
-
-        # Broadcast call_ended to other clients in session
-        for session_id, clients in session_connections.items():
-            if client_id in clients:
-                for other_client in clients:
-                    if other_client != client_id and other_client in active_connections:
-                        try:
-                            await active_connections[other_client].send_text(json.dumps({
-                                "type": "call_ended"
-                            }))
-                        except Exception:
-                            pass
-                break
-
-# Helper function to add client to session
-def add_client_to_session(session_id: str, client_id: str):
-    if session_id not in session_connections:
-        session_connections[session_id] = set()
-    session_connections[session_id].add(client_id)
+        pass
+    except Exception:
+        logger.exception("Signaling loop failed for client=%s", client_id)
+    finally:
+        # Every exit path: keep sessions for WS_RESUME_GRACE seconds in case the
+        # client reconnects (no-op if the socket was already replaced or removed)
+        await hub.detach(client_id, connection)
+
+# Replay call events a client missed, or tell it to reload if they were trimmed
+async def send_call_events(connection, last_seq):
+    try:
+        events = await call_events.since(int(last_seq))
+    except (TypeError, ValueError):
+        events = None
+    if events is None:
+        frame = {"type": "call_events", "reset": True, "seq": await call_events.current_seq()}
+    else:
+        frame = {"type": "call_events", "reset": False, "events": events}
+    connection.send_frame(frame)
+
+async def stop_session_recording(session_id: str):
+    try:
+        await recording_pool.stop_recording(session_id, SESSION_ROLE)
+    except Exception:
+        logger.exception("Failed to stop recording for session=%s", session_id)
 
 # Root endpoint
 @app.get("/")
@@ -0,0 +1,143 @@
+"""
+File streaming for recordings: single-range requests (206/416), ETag and
+Last-Modified validators (304). The body goes out in CHUNK_SIZE pread()s from
+a worker thread, so a download never holds the file in memory and never
+blocks the event loop.
+"""
+import os
+import stat
+import email.utils
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "./recordings")
+CHUNK_SIZE = 64 * 1024
+
+def resolve_recording_path(file_path: Optional[str]) -> Optional[str]:
+    """Absolute path of a recording file, None if missing or outside RECORDINGS_DIR"""
+    if not file_path:
+        return None
+    root = os.path.realpath(RECORDINGS_DIR)
+    path = os.path.realpath(file_path)
+    if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+        return None
+    return path
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range. Raises ValueError if it is
+    unsatisfiable, returns None for anything we serve in full (multi-range, junk).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not (first.isdigit() or first == "") or not (last.isdigit() or last == "") or first == last == "":
+        return None
+    if first == "":
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+class RangeFileResponse(Response):
+    def __init__(self, path: str, request_headers: Mapping[str, str], media_type: str = "video/webm",
+                 filename: Optional[str] = None):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        st = os.stat(path)
+        self.size = st.st_size
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+        self.range: Optional[Tuple[int, int]] = None
+
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": self.etag,
+            "last-modified": self.last_modified,
+            "cache-control": "private, no-cache",
+        }
+        if filename:
+            headers["content-disposition"] = f'inline; filename="{filename}"'
+
+        if self._not_modified(request_headers, st.st_mtime):
+            self.status_code = 304
+            self.init_headers(headers)
+            self.raw_headers = [(k, v) for k, v in self.raw_headers if k != b"content-length"]
+            return
+
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_ok(request_headers):
+            try:
+                self.range = _parse_range(range_header, self.size)
+            except ValueError:
+                self.status_code = 416
+                headers["content-range"] = f"bytes */{self.size}"
+                self.init_headers(headers)
+                return
+
+        if self.range:
+            start, end = self.range
+            self.status_code = 206
+            headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            headers["content-length"] = str(end - start + 1)
+        else:
+            self.status_code = 200
+            headers["content-length"] = str(self.size)
+        headers["content-type"] = media_type
+        self.init_headers(headers)
+
+    def _not_modified(self, request_headers: Mapping[str, str], mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return self.etag in tags or "*" in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since
+        return False
+
+    def _if_range_ok(self, request_headers: Mapping[str, str]) -> bool:
+        if_range = request_headers.get("if-range")
+        return not if_range or if_range in (self.etag, self.last_modified)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.status_code not in (200, 206) or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = self.range or (0, self.size - 1)
+        count = end - start + 1
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            if not stat.S_ISREG(os.fstat(fd).st_mode):
+                raise RuntimeError(f"{self.path} is not a regular file")
+            offset, more_body = start, True
+            while count > 0:
+                chunk = await anyio.to_thread.run_sync(os.pread, fd, min(CHUNK_SIZE, count), offset)
+                if not chunk:
+                    break
+                offset += len(chunk)
+                count -= len(chunk)
+                more_body = count > 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if more_body:
+                # Empty file, or it shrank underneath us: end the body
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            os.close(fd)
@@ -0,0 +1,160 @@
+"""
+In-process metrics in the Prometheus text format (served at /metrics).
+Counters and histograms are plain dicts keyed by label values, updated inline
+on the hot paths; gauges that mirror existing state (sockets, pending calls,
+recorders) are filled by collectors at scrape time instead.
+"""
+import time
+import bisect
+import logging
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger("metrics")
+
+# Seconds; covers sub-millisecond Redis scripts up to slow Telegram retries
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in self._values.items()]
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def time(self, *labels) -> _Timer:
+        """Context manager observing the elapsed seconds of its block"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+_collectors: List[Callable[[], Awaitable[None]]] = []
+
+def add_collector(collector: Callable[[], Awaitable[None]]):
+    """Register an async callback that refreshes gauges right before each scrape"""
+    _collectors.append(collector)
+
+async def render() -> str:
+    for collector in _collectors:
+        try:
+            await collector()
+        except Exception:
+            logger.exception("Metrics collector failed")
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.header())
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# HTTP
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency by route",
+                         ("method", "route", "status"))
+
+# WebSocket signaling
+WS_CONNECTIONS = Gauge("ws_connections", "Open signaling sockets in this process", ("role",))
+WS_DETACHED = Gauge("ws_detached_clients", "Dropped clients inside their resume grace period")
+WS_SESSIONS = Gauge("ws_sessions", "Call sessions with members on this process")
+WS_FRAMES_RECEIVED = Counter("ws_frames_received_total", "Frames received from clients", ("type",))
+WS_FRAMES_REJECTED = Counter("ws_frames_rejected_total", "Frames failing decode or schema validation",
+                             ("reason",))
+WS_FRAMES_DROPPED = Counter("ws_frames_dropped_total", "Frames dropped by the per-socket rate limit")
+WS_FRAMES_SENT = Counter("ws_frames_sent_total", "Frames queued to sockets", ("type",))
+WS_SEND_FAILURES = Counter("ws_send_failures_total", "Sockets evicted by the send path", ("reason",))
+WS_REAPED = Counter("ws_reaped_total", "Idle sockets, expired resumes and abandoned sessions reaped",
+                    ("reason",))
+
+# Backends
+DB_LATENCY = Histogram("db_query_duration_seconds", "DB thread pool call latency (queue wait included)",
+                       ("op",))
+REDIS_LATENCY = Histogram("redis_command_duration_seconds", "Redis script/command latency", ("op",))
+TELEGRAM_LATENCY = Histogram("telegram_send_duration_seconds", "Telegram sendMessage latency", ("result",))
+TELEGRAM_MESSAGES = Counter("telegram_messages_total",
+                            "Telegram outbox results (queued, sent, failed, retried, dropped, coalesced)",
+                            ("result",))
+
+# Application state
+PENDING_CALLS = Gauge("pending_calls", "Calls waiting for an agent")
+RECORDINGS_ACTIVE = Gauge("recordings_active", "Recordings assigned to recording workers")
+TELEGRAM_QUEUE = Gauge("telegram_queue_depth", "Messages waiting in the Telegram outbox")
+CALL_JOURNAL_QUEUE = Gauge("call_journal_depth", "Ended calls waiting for their end_time/duration write")
@@ -1,6 +1,16 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from datetime import datetime
 
+# Call lifecycle: status -> statuses it may move to. A caller may hang up
+# while still pending, so pending -> ended is valid too.
+CALL_TRANSITIONS = {
+    "pending": ("accepted", "rejected", "ended"),
+    "accepted": ("ended",),
+    "rejected": ("ended",),
+    "ended": (),
+}
+
 class AdminUser(SQLModel, table=True):
     id: int | None = Field(default=None, primary_key=True)
     username: str = Field(index=True)
@@ -10,13 +20,20 @@ class AdminUser(SQLModel, table=True):
 
 class CallSession(SQLModel, table=True):
     """Call session metadata"""
+    __table_args__ = (
+        # pending list / status-filtered history, newest first
+        Index("ix_callsession_status_start_time", "status", "start_time"),
+        # full history, newest first
+        Index("ix_callsession_start_time", "start_time"),
+    )
     id: int | None = Field(default=None, primary_key=True)
     session_id: str = Field(index=True, unique=True)
     caller_id: str = Field(index=True)
     caller_name: str
     agent_id: str | None = Field(default=None, index=True)
-    status: str = Field(default="pending")  # pending, accepted, rejected, ended
+    status: str = Field(default="pending")  # see CALL_TRANSITIONS
     start_time: datetime = Field(default_factory=datetime.utcnow)
+    accept_time: datetime | None = Field(default=None)  # set only by pending -> accepted
     end_time: datetime | None = Field(default=None)
     duration: int | None = Field(default=None)  # seconds
 
@@ -26,4 +43,5 @@ class Recording(SQLModel, table=True):
     role: str | None = Field(default=None)
     file_path: str | None = Field(default=None)
     size: int | None = Field(default=None)
+    tracks: str | None = Field(default=None)  # JSON list of {index, kind, role, mid}
     created_at: datetime = Field(default_factory=datetime.utcnow)
\ No newline at end of file
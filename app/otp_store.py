@@ -1,19 +1,70 @@
 import redis.asyncio as redis
 from typing import Optional
-import json
+
+from app import metrics
+
+# KEYS[1] otp hash; ARGV[1] otp, ARGV[2] expiry seconds
+_SET_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'otp', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+# KEYS[1] otp hash; ARGV[1] candidate otp, ARGV[2] max attempts
+# Returns 1 on match (code consumed), 0 on mismatch, -1 if missing/expired/exhausted
+_VERIFY_SCRIPT = """
+local stored = redis.call('HMGET', KEYS[1], 'otp', 'attempts')
+if not stored[1] then
+    return -1
+end
+local max_attempts = tonumber(ARGV[2])
+if tonumber(stored[2]) >= max_attempts then
+    redis.call('DEL', KEYS[1])
+    return -1
+end
+if stored[1] == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= max_attempts then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS[1] counter; ARGV[1] window seconds. Counter and its TTL are created together.
+_RATE_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 or redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
 
 class OTPStore:
+    """
+    OTP codes in a small Redis hash (otp, attempts). Set, verify and the
+    request rate limit are each one server-side script, so every operation is
+    a single round trip and parallel guesses cannot get past max_attempts.
+    """
+
     def __init__(self, redis_client: redis.Redis):
         self.redis = redis_client
         self.otp_prefix = "otp:"
+        self.rate_prefix = "otp_rate:"
         self.expiry_seconds = 300  # 5 minutes
+        self.max_attempts = 3
+        self._set = self.redis.register_script(_SET_SCRIPT)
+        self._verify = self.redis.register_script(_VERIFY_SCRIPT)
+        self._rate = self.redis.register_script(_RATE_SCRIPT)
 
     async def set_otp(self, username: str, otp: str) -> bool:
         """Store OTP with expiry"""
         key = f"{self.otp_prefix}{username}"
-        data = {"otp": otp, "attempts": 0}
         try:
-            await self.redis.setex(key, self.expiry_seconds, json.dumps(data))
+            with metrics.REDIS_LATENCY.time("otp_set"):
+                await self._set(keys=[key], args=[otp, self.expiry_seconds])
             return True
         except Exception:
             return False
@@ -22,26 +73,18 @@ class OTPStore:
         """Verify OTP and increment attempts"""
         key = f"{self.otp_prefix}{username}"
         try:
-            data_str = await self.redis.get(key)
-            if not data_str:
-                return False
-
-            data = json.loads(data_str)
-            if data["attempts"] >= 3:  # Max 3 attempts
-                await self.redis.delete(key)
-                return False
-
-            if data["otp"] == otp:
-                await self.redis.delete(key)  # Clear on success
-                return True
-            else:
-                data["attempts"] += 1
-                await self.redis.setex(key, self.expiry_seconds, json.dumps(data))
-                return False
+            with metrics.REDIS_LATENCY.time("otp_verify"):
+                return await self._verify(keys=[key], args=[otp, self.max_attempts]) == 1
         except Exception as e:
             print(f"OTP verification error: {e}")
             return False
 
+    async def allow_request(self, username: str, limit: int = 3, window: int = 60) -> bool:
+        """Count an OTP request, False once `limit` requests were made within `window` seconds"""
+        key = f"{self.rate_prefix}{username}"
+        with metrics.REDIS_LATENCY.time("otp_rate"):
+            return await self._rate(keys=[key], args=[window]) <= limit
+
     async def clear_otp(self, username: str) -> bool:
         """Manually clear OTP"""
         key = f"{self.otp_prefix}{username}"
@@ -0,0 +1,102 @@
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Awaitable, Dict, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger("pending_queue")
+
+# KEYS[1] ready marker, KEYS[2] zset, KEYS[3] payload hash; ARGV[1] session_id
+# Returns -1 if the queue was never built, 0 if someone else claimed it, else the payload
+_CLAIM_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+local payload = redis.call('HGET', KEYS[3], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return payload
+"""
+
+# KEYS[1] ready marker, KEYS[2] zset, KEYS[3] payload hash; ARGV[1] limit
+# Returns -1 if the queue was never built, else the newest payloads
+_LIST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local ids = redis.call('ZREVRANGE', KEYS[2], 0, tonumber(ARGV[1]) - 1)
+if #ids == 0 then
+    return {}
+end
+return redis.call('HMGET', KEYS[3], unpack(ids))
+"""
+
+def _score(call: Dict) -> float:
+    return datetime.fromisoformat(call["start_time"]).timestamp()
+
+class PendingQueue:
+    """
+    Pending calls in a Redis sorted set by arrival time, with the row payload
+    in a hash. claim() removes a call atomically, so exactly one agent wins.
+    """
+
+    def __init__(self, redis_client: redis.Redis, load_pending: Callable[[], Awaitable[List[Dict]]]):
+        self.redis = redis_client
+        self.load_pending = load_pending
+        self.ready_key = "pending_calls:ready"
+        self.zset_key = "pending_calls"
+        self.data_key = "pending_calls:data"
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._list = self.redis.register_script(_LIST_SCRIPT)
+
+    async def add(self, call: Dict):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self.data_key, call["session_id"], json.dumps(call))
+        pipe.zadd(self.zset_key, {call["session_id"]: _score(call)})
+        await pipe.execute()
+
+    async def remove(self, session_id: str):
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(self.zset_key, session_id)
+        pipe.hdel(self.data_key, session_id)
+        await pipe.execute()
+
+    async def claim(self, session_id: str) -> Optional[Dict]:
+        """Take a call off the queue, None if it is not pending (or already claimed)"""
+        keys = [self.ready_key, self.zset_key, self.data_key]
+        result = await self._claim(keys=keys, args=[session_id])
+        if result == -1:
+            await self.rebuild()
+            result = await self._claim(keys=keys, args=[session_id])
+        if not result or result == -1:
+            return None
+        return json.loads(result)
+
+    async def list(self, limit: int) -> List[Dict]:
+        """Newest pending calls first"""
+        keys = [self.ready_key, self.zset_key, self.data_key]
+        payloads = await self._list(keys=keys, args=[limit])
+        if payloads == -1:
+            await self.rebuild()
+            payloads = await self._list(keys=keys, args=[limit])
+        if payloads == -1:
+            return []
+        return [json.loads(p) for p in payloads if p]
+
+    async def count(self) -> int:
+        return await self.redis.zcard(self.zset_key)
+
+    async def rebuild(self):
+        """Refill the queue from the DB (cold start or after Redis lost its data)"""
+        calls = await self.load_pending()
+        # Additive only: calls queued by notify_call meanwhile must survive
+        pipe = self.redis.pipeline(transaction=True)
+        for call in calls:
+            pipe.hset(self.data_key, call["session_id"], json.dumps(call))
+            pipe.zadd(self.zset_key, {call["session_id"]: _score(call)})
+        pipe.set(self.ready_key, 1)
+        await pipe.execute()
+        logger.info("Pending queue rebuilt from DB: %s calls", len(calls))
@@ -0,0 +1,90 @@
+import os
+import time
+import logging
+from datetime import datetime
+from typing import Optional
+
+import redis.asyncio as redis
+
+from app import crud
+
+logger = logging.getLogger("quota")
+
+CALL_QUOTA_LIMIT = int(os.getenv("CALL_QUOTA_LIMIT", "10"))
+# Window length in seconds, aligned to UTC epoch (86400 = calendar day)
+CALL_QUOTA_WINDOW = int(os.getenv("CALL_QUOTA_WINDOW", "86400"))
+
+# Returns -1 if the counter is missing (cold start), 0 if the limit is reached, 1 if reserved
+_RESERVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if not current then
+    return -1
+end
+if tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('INCR', KEYS[1])
+return 1
+"""
+
+_RELEASE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+class CallQuota:
+    """
+    Atomic per-window call counter in Redis. reserve() is a single script call
+    that checks and increments together, so concurrent accepts cannot both pass
+    the limit. A missing counter is rebuilt from the DB once per window.
+    """
+
+    def __init__(self, redis_client: redis.Redis, limit: int = CALL_QUOTA_LIMIT,
+                 window: int = CALL_QUOTA_WINDOW):
+        self.redis = redis_client
+        self.limit = limit
+        self.window = window
+        self.key_prefix = "call_quota:"
+        self._reserve = self.redis.register_script(_RESERVE_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+
+    def _bucket(self) -> int:
+        return int(time.time()) // self.window
+
+    def _key(self, bucket: int) -> str:
+        return f"{self.key_prefix}{self.window}:{bucket}"
+
+    async def reserve(self) -> Optional[str]:
+        """
+        Take one slot of the current window. Returns the reservation (the window
+        key) to hand to release(), None if the limit is reached.
+        """
+        bucket = self._bucket()
+        key = self._key(bucket)
+        result = await self._reserve(keys=[key], args=[self.limit])
+        if result == -1:
+            await self._rebuild(bucket)
+            result = await self._reserve(keys=[key], args=[self.limit])
+        return key if result == 1 else None
+
+    async def release(self, reservation: str):
+        """
+        Give back a slot taken by reserve() when the accept did not go through,
+        in the window it was taken from even if a new one has started since
+        """
+        try:
+            await self._release(keys=[reservation])
+        except Exception:
+            logger.exception("Failed to release call quota")
+
+    async def _rebuild(self, bucket: int):
+        """Seed the counter from calls of the window that were accepted (cold start)"""
+        window_start = datetime.utcfromtimestamp(bucket * self.window)
+        used = await crud.count_accepted_since(window_start)
+        ttl = (bucket + 1) * self.window - int(time.time()) + self.window
+        # NX: another worker may have seeded and reserved in the meantime
+        await self.redis.set(self._key(bucket), used, nx=True, ex=max(ttl, 1))
+        logger.info("Call quota rebuilt from DB: window=%s used=%s", window_start, used)
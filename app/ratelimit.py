@@ -0,0 +1,179 @@
+import os
+import math
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+
+from app import metrics
+
+logger = logging.getLogger("ratelimit")
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# Number of trusted reverse proxies in front of the app (0 = use the socket peer).
+# The client IP is the X-Forwarded-For entry the outermost trusted proxy appended;
+# entries left of it come from the client and may be forged.
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("RATE_LIMIT_TRUST_PROXY", "0"))
+# Per-socket signaling frame budget
+WS_MSG_RATE = float(os.getenv("WS_MSG_RATE", "50"))
+WS_MSG_BURST = float(os.getenv("WS_MSG_BURST", "100"))
+# Frames dropped over budget before the socket is closed
+WS_MSG_MAX_DROPS = int(os.getenv("WS_MSG_MAX_DROPS", "50"))
+
+# KEYS[1] bucket hash; ARGV[1] rate (tokens/s), ARGV[2] burst, ARGV[3] now (ms), ARGV[4] cost
+_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+@dataclass
+class Policy:
+    """
+    Token bucket: `rate` tokens per second, up to `burst`; key is ip, route or
+    client (the caller_id of the request body, checked by the route handler)
+    """
+    name: str
+    rate: float
+    burst: float
+    key: str = "ip"
+
+# Route prefix -> policy, first match wins
+ROUTE_POLICIES: List[Tuple[str, Policy]] = [
+    # Loose per-IP cap: customers behind one NAT/proxy share it, NOTIFY_POLICY
+    # below is the per-caller limit
+    ("/api/call/notify", Policy("notify_ip", rate=2, burst=60)),
+    ("/api/call/", Policy("call", rate=1, burst=20)),
+    ("/api/auth/", Policy("auth", rate=20 / 60, burst=10)),
+    ("/api/calls/", Policy("calls", rate=2, burst=30)),
+    ("/api/record/", Policy("record", rate=1, burst=10)),
+    # Players issue a burst of Range requests while seeking
+    ("/api/recordings", Policy("recordings", rate=5, burst=60)),
+]
+
+# Per caller_id, enforced in notify_call once the body is parsed
+NOTIFY_POLICY = Policy("notify", rate=10 / 60, burst=5, key="client")
+
+def match_policy(path: str) -> Optional[Policy]:
+    for prefix, policy in ROUTE_POLICIES:
+        if path.startswith(prefix):
+            return policy
+    return None
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: float
+    remaining: float
+    rate: float
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(int(self.limit)),
+            "RateLimit-Remaining": str(int(self.remaining)),
+            "RateLimit-Reset": str(math.ceil((self.limit - self.remaining) / self.rate)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil((1 - self.remaining) / self.rate)))
+        return headers
+
+class TokenBucket:
+    """In-process token bucket"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+class RateLimiter:
+    """
+    Shared token buckets in Redis (one script call per hit). Each process keeps
+    a local bucket per key with the same policy first: if this process alone
+    already spent the budget the shared bucket is empty too, so the request is
+    refused without a Redis round trip. Redis errors fail open.
+    """
+
+    def __init__(self, redis_client: redis.Redis, local_size: int = 10000):
+        self.redis = redis_client
+        self.key_prefix = "ratelimit:"
+        self.local_size = local_size
+        self._local: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._bucket = self.redis.register_script(_BUCKET_SCRIPT)
+
+    def _local_bucket(self, key: str, policy: Policy) -> TokenBucket:
+        bucket = self._local.get(key)
+        if bucket is None:
+            bucket = self._local[key] = TokenBucket(policy.rate, policy.burst)
+            if len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+        else:
+            self._local.move_to_end(key)
+        return bucket
+
+    async def hit(self, policy: Policy, identity: str, cost: float = 1) -> Decision:
+        key = f"{self.key_prefix}{policy.name}:{identity}"
+        local = self._local_bucket(key, policy)
+        if not local.take(cost):
+            return Decision(False, policy.burst, local.tokens, policy.rate)
+        try:
+            with metrics.REDIS_LATENCY.time("ratelimit"):
+                allowed, tokens = await self._bucket(
+                    keys=[key], args=[policy.rate, policy.burst, int(time.time() * 1000), cost])
+        except Exception:
+            logger.exception("Rate limiter unavailable, allowing request")
+            return Decision(True, policy.burst, local.tokens, policy.rate)
+        return Decision(allowed == 1, policy.burst, float(tokens), policy.rate)
+
+def client_ip(headers, client) -> str:
+    if RATE_LIMIT_TRUST_PROXY > 0:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+            if hops:
+                return hops[max(0, len(hops) - RATE_LIMIT_TRUST_PROXY)]
+    return client.host if client else "unknown"
+
+class SocketRateLimit:
+    """Per-socket frame budget: excess frames are dropped, a persistent flood closes the socket"""
+
+    def __init__(self, rate: float = WS_MSG_RATE, burst: float = WS_MSG_BURST,
+                 max_drops: int = WS_MSG_MAX_DROPS):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_drops = max_drops
+        self.dropped = 0
+
+    def allow(self) -> bool:
+        if self.bucket.take():
+            return True
+        self.dropped += 1
+        return False
+
+    @property
+    def exceeded(self) -> bool:
+        return self.dropped > self.max_drops
@@ -0,0 +1,246 @@
+"""
+Recording engine in worker processes. Each worker runs its own event loop with
+app.webrtc_handler (aiortc peer connections, MediaRecorder/ffmpeg); the API
+process only forwards SDP offers/answers and stop requests over a pipe, so
+media decode/encode never runs on the signaling event loop.
+"""
+import os
+import asyncio
+import logging
+import itertools
+import multiprocessing
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("recording_pool")
+
+RECORDING_ENABLED = os.getenv("RECORDING_ENABLED", "0") == "1"
+RECORDING_WORKERS = int(os.getenv("RECORDING_WORKERS", str(os.cpu_count() or 1)))
+# Admission control: concurrent recordings one worker accepts
+RECORDING_MAX_PER_WORKER = int(os.getenv("RECORDING_MAX_PER_WORKER", "8"))
+# Seconds to wait for a worker to answer one request
+RECORDING_CALL_TIMEOUT = float(os.getenv("RECORDING_CALL_TIMEOUT", "20"))
+
+# Per-call recording: one peer connection carries both legs, one file per call
+SESSION_ROLE = "session"
+
+class RecordingCapacityError(Exception):
+    """Every worker is at RECORDING_MAX_PER_WORKER"""
+
+class RecordingWorkerError(Exception):
+    """A worker failed or died while handling a request"""
+
+# Worker process side
+
+def _worker_main(conn):
+    asyncio.run(_serve(conn))
+
+async def _serve(conn):
+    from app import webrtc_handler
+
+    loop = asyncio.get_running_loop()
+    requests: asyncio.Queue = asyncio.Queue()
+
+    def on_readable():
+        try:
+            requests.put_nowait(conn.recv())
+        except EOFError:
+            loop.remove_reader(conn.fileno())
+            requests.put_nowait(None)
+
+    async def handle(request):
+        op, args = request["op"], request["args"]
+        try:
+            if op == "offer":
+                result = await webrtc_handler.handle_record_offer(*args)
+            elif op == "stop":
+                result = await webrtc_handler.stop_recording(*args)
+            elif op == "stats":
+                result = webrtc_handler.recorder_stats()
+            else:
+                raise ValueError(f"unknown op {op}")
+            conn.send({"id": request["id"], "ok": True, "result": result})
+        except webrtc_handler.RecorderLimitError as e:
+            conn.send({"id": request["id"], "ok": False, "error": str(e), "capacity": True})
+        except Exception as e:
+            logger.exception("Recording worker failed op=%s", op)
+            conn.send({"id": request["id"], "ok": False, "error": repr(e)})
+
+    def on_reaped(session_id, role):
+        # Unsolicited: lets the pool free the slot of a recorder nobody stopped
+        conn.send({"event": "reaped", "session_id": session_id, "role": role})
+
+    loop.add_reader(conn.fileno(), on_readable)
+    supervisor = asyncio.create_task(webrtc_handler.supervise(on_reaped))
+    tasks = set()
+    while True:
+        request = await requests.get()
+        if request is None:
+            break
+        task = asyncio.create_task(handle(request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    # Shutdown: finish in-flight requests, then close every recorder cleanly
+    supervisor.cancel()
+    await asyncio.gather(supervisor, *tasks, return_exceptions=True)
+    for key in list(webrtc_handler._active_recorders):
+        session_id, _, role = key.partition("::")
+        await webrtc_handler.stop_recording(None if session_id == "nosess" else session_id, role)
+
+# API process side
+
+class _Worker:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.active = 0
+        self.pending: Dict[int, asyncio.Future] = {}
+
+class RecordingWorkerPool:
+    """
+    Fixed pool of recording processes. A (session_id, role) recording sticks
+    to the worker that took its offer; new recordings go to the least loaded
+    worker with free capacity, else RecordingCapacityError.
+    """
+
+    def __init__(self, workers: int = RECORDING_WORKERS, max_per_worker: int = RECORDING_MAX_PER_WORKER):
+        self.size = max(1, workers)
+        self.max_per_worker = max_per_worker
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: Dict[int, _Worker] = {}
+        self._assignments: Dict[Tuple[str, str], int] = {}
+        self._ids = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return self.size * self.max_per_worker
+
+    @property
+    def active(self) -> int:
+        return sum(worker.active for worker in self._workers.values())
+
+    async def start(self):
+        for index in range(self.size):
+            self._spawn(index)
+        logger.info("Recording pool started: %s workers x %s recordings", self.size, self.max_per_worker)
+
+    def _spawn(self, index: int):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), daemon=True,
+                                    name=f"recording-worker-{index}")
+        process.start()
+        child_conn.close()
+        worker = _Worker(index, process, parent_conn)
+        self._workers[index] = worker
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_readable, worker)
+
+    def _on_readable(self, worker: _Worker):
+        try:
+            reply = worker.conn.recv()
+        except (EOFError, OSError):
+            self._worker_died(worker)
+            return
+        if reply.get("event") == "reaped":
+            key = (reply["session_id"] or "", reply["role"])
+            if self._assignments.get(key) == worker.index:
+                self._release(key)
+            return
+        future = worker.pending.pop(reply["id"], None)
+        if future is None or future.done():
+            return
+        if reply["ok"]:
+            future.set_result(reply["result"])
+        elif reply.get("capacity"):
+            future.set_exception(RecordingCapacityError(reply["error"]))
+        else:
+            future.set_exception(RecordingWorkerError(reply["error"]))
+
+    def _worker_died(self, worker: _Worker):
+        logger.error("Recording worker %s exited (code=%s), respawning", worker.index, worker.process.exitcode)
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        for future in worker.pending.values():
+            if not future.done():
+                future.set_exception(RecordingWorkerError("worker died"))
+        worker.pending.clear()
+        self._assignments = {key: index for key, index in self._assignments.items() if index != worker.index}
+        if self._workers.get(worker.index) is worker:
+            self._spawn(worker.index)
+
+    async def _call(self, worker: _Worker, op: str, *args):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = future
+        worker.conn.send({"id": request_id, "op": op, "args": args})
+        try:
+            return await asyncio.wait_for(future, RECORDING_CALL_TIMEOUT)
+        finally:
+            worker.pending.pop(request_id, None)
+
+    async def start_recording(self, sdp: str, sdp_type: str, session_id: Optional[str], role: str,
+                              track_roles: Optional[Dict[str, str]] = None) -> Dict:
+        key = (session_id or "", role)
+        index = self._assignments.get(key)
+        if index is None:
+            candidates = [w for w in self._workers.values() if w.active < self.max_per_worker]
+            if not candidates:
+                raise RecordingCapacityError()
+            worker = min(candidates, key=lambda w: w.active)
+            worker.active += 1
+            self._assignments[key] = worker.index
+        else:
+            # Re-offer for a running recording: the worker replaces it in place
+            worker = self._workers[index]
+        try:
+            return await self._call(worker, "offer", sdp, sdp_type, session_id, role, track_roles)
+        except Exception:
+            self._release(key)
+            raise
+
+    async def stop_recording(self, session_id: Optional[str], role: str) -> Optional[Dict]:
+        key = (session_id or "", role)
+        index = self._assignments.get(key)
+        if index is None:
+            return None
+        try:
+            return await self._call(self._workers[index], "stop", session_id, role)
+        finally:
+            self._release(key)
+
+    async def stats(self) -> Dict:
+        """Pool occupancy plus each worker's live recorders, memory and FD use"""
+        async def worker_stats(worker: _Worker):
+            try:
+                return await self._call(worker, "stats")
+            except Exception as e:
+                return {"error": repr(e)}
+        workers = list(self._workers.values())
+        results = await asyncio.gather(*(worker_stats(w) for w in workers))
+        return {
+            "capacity": self.capacity,
+            "assigned": self.active,
+            "workers": [dict(result, index=w.index, assigned=w.active) for w, result in zip(workers, results)],
+        }
+
+    def _release(self, key: Tuple[str, str]):
+        index = self._assignments.pop(key, None)
+        worker = self._workers.get(index) if index is not None else None
+        if worker is not None and worker.active > 0:
+            worker.active -= 1
+
+    async def stop(self, timeout: float = 10):
+        """Ask workers to close their recorders and exit, terminate stragglers"""
+        loop = asyncio.get_running_loop()
+        workers, self._workers = list(self._workers.values()), {}
+        for worker in workers:
+            loop.remove_reader(worker.conn.fileno())
+            try:
+                worker.conn.close()  # EOF tells the worker to shut down
+            except OSError:
+                pass
+        for worker in workers:
+            await loop.run_in_executor(None, worker.process.join, timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._assignments.clear()
@@ -0,0 +1,183 @@
+"""
+Background retention for RECORDINGS_DIR. Each sweep reconciles the directory
+with the Recording table (rows whose file is gone are dropped; files without a
+row are only deleted with RETENTION_DELETE_ORPHANS=1, once they are older than
+RETENTION_ORPHAN_GRACE, so files still being recorded are never touched), then
+deletes recordings oldest first until none is older than RETENTION_MAX_AGE_DAYS
+and the directory fits in RETENTION_MAX_BYTES. Everything is opt-in: nothing is
+deleted unless RETENTION_ENABLED=1 and a policy is set. Deletes run in batches of RETENTION_BATCH with a
+RETENTION_IO_PAUSE sleep between batches, and rows go in one DELETE per
+batch. A Redis lock keeps one sweeper running across processes.
+"""
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+
+from app import crud
+from app.media import RECORDINGS_DIR
+
+logger = logging.getLogger("retention")
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "0") == "1"
+# 0 disables a policy
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_MAX_BYTES = int(os.getenv("RETENTION_MAX_BYTES", "0"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "600"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "100"))
+# Seconds to sleep between delete batches, leaves disk bandwidth to live recordings
+RETENTION_IO_PAUSE = float(os.getenv("RETENTION_IO_PAUSE", "0.2"))
+# Files without a row younger than this are assumed to be recordings in progress
+RETENTION_ORPHAN_GRACE = float(os.getenv("RETENTION_ORPHAN_GRACE", "3600"))
+# Files without a row may be recordings whose DB save failed, keep them unless asked
+RETENTION_DELETE_ORPHANS = os.getenv("RETENTION_DELETE_ORPHANS", "0") == "1"
+
+@dataclass
+class _File:
+    path: str
+    size: int
+    mtime: float
+    recording_id: Optional[int] = None
+
+def _scan(root: str) -> Dict[str, _File]:
+    files: Dict[str, _File] = {}
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return files
+    with entries:
+        for entry in entries:
+            try:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            path = os.path.realpath(entry.path)
+            files[path] = _File(path, st.st_size, st.st_mtime)
+    return files
+
+def _without_files(ids: List[int], paths: Dict[int, Optional[str]]) -> List[int]:
+    return [i for i in ids if not (paths[i] and os.path.isfile(paths[i]))]
+
+def _unlink(paths: List[str]) -> int:
+    freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+        except OSError:
+            logger.exception("Failed to delete recording file %s", path)
+    return freed
+
+class RetentionSweeper:
+    def __init__(self, redis_client: redis.Redis, root: str = RECORDINGS_DIR,
+                 max_age_days: float = RETENTION_MAX_AGE_DAYS, max_bytes: int = RETENTION_MAX_BYTES,
+                 interval: float = RETENTION_INTERVAL, batch: int = RETENTION_BATCH,
+                 io_pause: float = RETENTION_IO_PAUSE, orphan_grace: float = RETENTION_ORPHAN_GRACE,
+                 delete_orphans: bool = RETENTION_DELETE_ORPHANS):
+        self.redis = redis_client
+        self.root = os.path.realpath(root)
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.batch = max(1, batch)
+        self.io_pause = io_pause
+        self.orphan_grace = orphan_grace
+        self.delete_orphans = delete_orphans
+        self.lock_key = "recording_retention:lock"
+        self.stats: Dict[str, int] = {"runs": 0, "files_deleted": 0, "rows_deleted": 0,
+                                      "orphan_files": 0, "orphan_rows": 0, "bytes_freed": 0,
+                                      "total_bytes": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.redis.set(self.lock_key, "1", nx=True, ex=max(1, int(self.interval))):
+                    await self.sweep()
+            except Exception:
+                logger.exception("Recording retention sweep failed")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self):
+        """One reconcile + policy pass"""
+        files = await asyncio.to_thread(_scan, self.root)
+
+        # Rows -> files: attach ids, collect rows whose file no longer exists
+        missing_rows: List[int] = []
+        rows_paths: Dict[int, Optional[str]] = {}
+        after_id = 0
+        while True:
+            rows = await crud.recording_files(after_id, self.batch * 10)
+            if not rows:
+                break
+            for recording_id, file_path in rows:
+                f = files.get(os.path.realpath(file_path)) if file_path else None
+                if f is None:
+                    missing_rows.append(recording_id)
+                    rows_paths[recording_id] = file_path
+                else:
+                    f.recording_id = recording_id
+            after_id = rows[-1][0]
+        # Recordings finished after the scan have a row but were not scanned
+        missing_rows = await asyncio.to_thread(_without_files, missing_rows, rows_paths)
+        for i in range(0, len(missing_rows), self.batch):
+            self.stats["orphan_rows"] += await crud.delete_recordings(missing_rows[i:i + self.batch])
+
+        # Files -> rows: old files nobody recorded a row for
+        now = time.time()
+        orphans = [f for f in files.values()
+                   if f.recording_id is None and now - f.mtime > self.orphan_grace]
+        if self.delete_orphans:
+            await self._delete(orphans, orphan=True)
+        elif orphans:
+            logger.info("Retention: keeping %s files without a recording row", len(orphans))
+            orphans = []
+
+        # Policies over recorded files, oldest first
+        recorded = sorted((f for f in files.values() if f.recording_id is not None), key=lambda f: f.mtime)
+        # In-progress files count against the quota but are never deleted here
+        total = sum(f.size for f in files.values()
+                    if f.recording_id is not None or now - f.mtime <= self.orphan_grace)
+        expired: List[_File] = []
+        for f in recorded:
+            too_old = self.max_age > 0 and now - f.mtime > self.max_age
+            over_quota = self.max_bytes > 0 and total > self.max_bytes
+            if not (too_old or over_quota):
+                break
+            expired.append(f)
+            total -= f.size
+        await self._delete(expired)
+
+        self.stats["runs"] += 1
+        self.stats["total_bytes"] = total
+        if orphans or expired or missing_rows:
+            logger.info("Retention: %s expired, %s orphan files, %s orphan rows, %s bytes in use",
+                        len(expired), len(orphans), len(missing_rows), total)
+
+    async def _delete(self, files: List[_File], orphan: bool = False):
+        for i in range(0, len(files), self.batch):
+            batch = files[i:i + self.batch]
+            self.stats["bytes_freed"] += await asyncio.to_thread(_unlink, [f.path for f in batch])
+            self.stats["orphan_files" if orphan else "files_deleted"] += len(batch)
+            ids = [f.recording_id for f in batch if f.recording_id is not None]
+            self.stats["rows_deleted"] += await crud.delete_recordings(ids)
+            if self.io_pause:
+                await asyncio.sleep(self.io_pause)
@@ -0,0 +1,142 @@
+import os
+import uuid
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+import redis.asyncio as redis
+
+from app import codec
+
+logger = logging.getLogger("signaling")
+
+# "local" keeps signaling inside this process, "redis" fans frames out over pub/sub
+SIGNALING_BACKEND = os.getenv("SIGNALING_BACKEND", "local")
+SIGNAL_CHANNEL_PREFIX = "signal:"
+AGENTS_CHANNEL = f"{SIGNAL_CHANNEL_PREFIX}agents"
+
+# Called with every envelope that reaches this process
+Deliver = Callable[[Dict], Awaitable[None]]
+
+def session_channel(session_id: str) -> str:
+    return f"{SIGNAL_CHANNEL_PREFIX}session:{session_id}"
+
+def make_envelope(frame: Dict, session_id: Optional[str] = None, role: Optional[str] = None,
+                  exclude: Optional[str] = None) -> Dict:
+    """
+    Wrap a frame with its routing info. session_id=None means the agent broadcast,
+    role limits delivery to "caller" or "agent" clients, exclude skips one client_id.
+    """
+    return {"frame": frame, "session_id": session_id, "role": role, "exclude": exclude}
+
+class LocalSignalingBackend:
+    """Single-process backend: envelopes go straight to this process' sockets"""
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    async def watch_session(self, session_id: str):
+        pass
+
+    async def unwatch_session(self, session_id: str):
+        pass
+
+    async def publish_session(self, session_id: str, frame: Dict, role: Optional[str] = None,
+                              exclude: Optional[str] = None):
+        if self._deliver:
+            await self._deliver(make_envelope(frame, session_id, role, exclude))
+
+    async def publish_agents(self, frame: Dict):
+        if self._deliver:
+            await self._deliver(make_envelope(frame, role="agent"))
+
+class RedisSignalingBackend:
+    """
+    Multi-worker backend. Every process subscribes to the agent channel and to the
+    channel of each session that has a socket connected to it, so a frame published
+    by any worker or node reaches the peer wherever its socket lives.
+    """
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+        self.node_id = uuid.uuid4().hex
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._deliver: Optional[Deliver] = None
+        self._watch_counts: Dict[str, int] = {}
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(AGENTS_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("Redis signaling started node=%s", self.node_id)
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub:
+            try:
+                await self._pubsub.unsubscribe()
+                await self._pubsub.close()
+            except Exception:
+                logger.exception("Error closing signaling pubsub")
+            self._pubsub = None
+        self._watch_counts.clear()
+
+    async def watch_session(self, session_id: str):
+        """Subscribe to a session channel when its first local socket joins"""
+        count = self._watch_counts.get(session_id, 0)
+        self._watch_counts[session_id] = count + 1
+        if count == 0 and self._pubsub:
+            await self._pubsub.subscribe(session_channel(session_id))
+
+    async def unwatch_session(self, session_id: str):
+        """Unsubscribe once the last local socket leaves the session"""
+        count = self._watch_counts.get(session_id, 0)
+        if count <= 1:
+            self._watch_counts.pop(session_id, None)
+            if count == 1 and self._pubsub:
+                await self._pubsub.unsubscribe(session_channel(session_id))
+        else:
+            self._watch_counts[session_id] = count - 1
+
+    async def publish_session(self, session_id: str, frame: Dict, role: Optional[str] = None,
+                              exclude: Optional[str] = None):
+        envelope = make_envelope(frame, session_id, role, exclude)
+        await self.redis.publish(session_channel(session_id), codec.dumps(envelope))
+
+    async def publish_agents(self, frame: Dict):
+        await self.redis.publish(AGENTS_CHANNEL, codec.dumps(make_envelope(frame, role="agent")))
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                envelope = codec.loads(message["data"])
+                if self._deliver:
+                    await self._deliver(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Signaling listener error")
+                await asyncio.sleep(1)
+
+def create_signaling_backend(redis_client: redis.Redis):
+    """Pick the backend from SIGNALING_BACKEND"""
+    if SIGNALING_BACKEND == "redis":
+        return RedisSignalingBackend(redis_client)
+    return LocalSignalingBackend()
@@ -1,32 +1,217 @@
 import os
+import time
 import httpx
+import random
+import asyncio
+import logging
 import secrets
-from typing import Optional
+from typing import Dict, List, Optional
+
+from app import metrics
+
+logger = logging.getLogger("telegram_bot")
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_ADMIN_CHAT_ID = os.getenv("TELEGRAM_ADMIN_CHAT_ID", "")
+# Override to point at a local fake Telegram server in tests
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Outbox tuning
+TELEGRAM_CONCURRENCY = int(os.getenv("TELEGRAM_CONCURRENCY", "2"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "4"))
+TELEGRAM_DIGEST_WINDOW = float(os.getenv("TELEGRAM_DIGEST_WINDOW", "2"))
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))
+# Upper bound for a 429 retry_after sleep, so one response cannot stall a worker
+TELEGRAM_MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "30"))
+
+# One pooled client for the whole process (keep-alive, no TLS handshake per message)
+_client: Optional[httpx.AsyncClient] = None
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=5,
+            limits=httpx.Limits(max_connections=TELEGRAM_CONCURRENCY + 2,
+                                max_keepalive_connections=TELEGRAM_CONCURRENCY + 2),
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+async def _post_message(text: str, chat_id: str) -> httpx.Response:
+    url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+    start = time.perf_counter()
+    result = "error"
+    try:
+        resp = await get_client().post(url, json={"chat_id": chat_id, "text": text, "parse_mode": "HTML"})
+        result = str(resp.status_code)
+        return resp
+    finally:
+        metrics.TELEGRAM_LATENCY.observe(time.perf_counter() - start, result)
+
+def _target_chat(chat_id: Optional[str]) -> Optional[str]:
+    if not TELEGRAM_BOT_TOKEN:
+        return None
+    return chat_id or TELEGRAM_ADMIN_CHAT_ID or None
 
 async def send_telegram_message(text: str, chat_id: Optional[str] = None) -> bool:
     """Send message to Telegram chat"""
-    if not TELEGRAM_BOT_TOKEN:
-        return False
-    target_chat = chat_id or TELEGRAM_ADMIN_CHAT_ID
+    target_chat = _target_chat(chat_id)
     if not target_chat:
         return False
-    
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    async with httpx.AsyncClient() as client:
+    try:
+        resp = await _post_message(text, target_chat)
+        return resp.status_code == 200
+    except Exception:
+        return False
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _call_message(caller_names: List[str]) -> str:
+    if len(caller_names) == 1:
+        return f"\U0001F514 <b>Biri seni arıyor</b>\n\n\U0001F464 {_escape(caller_names[0])}"
+    lines = "\n".join(f"\U0001F464 {_escape(name)}" for name in caller_names)
+    return f"\U0001F514 <b>{len(caller_names)} kişi seni arıyor</b>\n\n{lines}"
+
+class TelegramOutbox:
+    """
+    Background delivery queue for Telegram messages: bounded concurrency,
+    retry with backoff on 429/5xx/network errors, and call notifications
+    coalesced into one digest per TELEGRAM_DIGEST_WINDOW.
+    enqueue() returns a future resolving to True/False; stats counts results
+    and mirrors them to the telegram_messages_total counter.
+    """
+
+    def __init__(self, concurrency: int = TELEGRAM_CONCURRENCY, max_retries: int = TELEGRAM_MAX_RETRIES,
+                 digest_window: float = TELEGRAM_DIGEST_WINDOW, queue_size: int = TELEGRAM_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.digest_window = digest_window
+        self.queue_size = queue_size
+        self.stats: Dict[str, int] = {"queued": 0, "sent": 0, "failed": 0, "retried": 0,
+                                      "dropped": 0, "coalesced": 0}
+        self.last_error: Optional[str] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._digest_names: List[str] = []
+        self._digest_task: Optional[asyncio.Task] = None
+
+    def _count(self, result: str):
+        self.stats[result] += 1
+        metrics.TELEGRAM_MESSAGES.inc(result)
+
+    @property
+    def depth(self) -> int:
+        """Messages queued and not yet picked up by a worker"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout: float = 5):
+        """Flush the pending digest, give queued messages `timeout` seconds, then stop"""
+        if self._digest_task:
+            self._digest_task.cancel()
+            self._digest_task = None
+        self._flush_digest()
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Telegram outbox stopped with %s undelivered messages", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await close_client()
+
+    def enqueue(self, text: str, chat_id: Optional[str] = None) -> "asyncio.Future[bool]":
+        """Queue a message without waiting for delivery"""
+        future = asyncio.get_running_loop().create_future()
+        target_chat = _target_chat(chat_id)
+        if not target_chat or self._queue is None:
+            future.set_result(False)
+            return future
         try:
-            resp = await client.post(url, json={"chat_id": target_chat, "text": text, "parse_mode": "HTML"}, timeout=5)
-            return resp.status_code == 200
-        except Exception:
-            return False
+            self._queue.put_nowait((text, target_chat, future))
+            self._count("queued")
+        except asyncio.QueueFull:
+            self._count("dropped")
+            future.set_result(False)
+        return future
+
+    def enqueue_call(self, caller_name: str):
+        """Queue an incoming call notification; calls within the window share one message"""
+        self._digest_names.append(caller_name)
+        if len(self._digest_names) > 1:
+            self._count("coalesced")
+        if self._digest_task is None:
+            self._digest_task = asyncio.create_task(self._digest_after_window())
+
+    async def _digest_after_window(self):
+        await asyncio.sleep(self.digest_window)
+        self._digest_task = None
+        self._flush_digest()
+
+    def _flush_digest(self):
+        names, self._digest_names = self._digest_names, []
+        if names:
+            self.enqueue(_call_message(names))
+
+    async def _worker(self):
+        while True:
+            text, chat_id, future = await self._queue.get()
+            try:
+                ok = await self._deliver(text, chat_id)
+            except Exception as e:
+                self.last_error = repr(e)
+                ok = False
+            finally:
+                self._queue.task_done()
+            self._count("sent" if ok else "failed")
+            if not future.done():
+                future.set_result(ok)
+
+    async def _deliver(self, text: str, chat_id: str) -> bool:
+        for attempt in range(self.max_retries + 1):
+            delay = min(0.5 * 2 ** attempt, 30) * (0.5 + random.random() / 2)
+            try:
+                resp = await _post_message(text, chat_id)
+                if resp.status_code == 200:
+                    return True
+                self.last_error = f"HTTP {resp.status_code}"
+                if resp.status_code == 429:
+                    try:
+                        delay = min(float(resp.json()["parameters"]["retry_after"]), TELEGRAM_MAX_RETRY_AFTER)
+                    except Exception:
+                        pass
+                elif resp.status_code < 500:
+                    return False
+            except httpx.HTTPError as e:
+                self.last_error = repr(e)
+            if attempt < self.max_retries:
+                self._count("retried")
+                await asyncio.sleep(delay)
+        logger.warning("Telegram delivery failed after %s attempts: %s", self.max_retries + 1, self.last_error)
+        return False
+
+# Process-wide outbox, started and stopped by the app lifespan
+outbox = TelegramOutbox()
 
 async def send_call_notification(caller_name: str) -> bool:
     """Notify admin about incoming call"""
-    safe_name = caller_name.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-    message = f"\U0001F514 <b>Biri seni arıyor</b>\n\n\U0001F464 {safe_name}"
-    return await send_telegram_message(message)
+    return await send_telegram_message(_call_message([caller_name]))
+
+def queue_call_notification(caller_name: str):
+    """Notify admin about incoming call in the background (coalesced)"""
+    outbox.enqueue_call(caller_name)
 
 def generate_otp() -> str:
     """Generate 6-digit OTP"""
@@ -1,71 +1,130 @@
 import os
+import json
+import time
 import uuid
 import asyncio
 import logging
-from typing import Dict, Optional
+import resource
+from typing import Callable, Dict, List, Optional
 
 from aiortc import RTCPeerConnection, RTCSessionDescription, MediaRecorder
 
 RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", "./recordings")
+# Seconds a recorder may stay unconnected, failed or without live tracks before it is reaped
+RECORDER_IDLE_TIMEOUT = float(os.getenv("RECORDER_IDLE_TIMEOUT", "30"))
+# Hard limit on one recording (seconds, 0 = none)
+RECORDER_MAX_DURATION = float(os.getenv("RECORDER_MAX_DURATION", "14400"))
+# Per-process and per-session recorder caps
+RECORDER_MAX_ACTIVE = int(os.getenv("RECORDER_MAX_ACTIVE", "16"))
+RECORDER_MAX_PER_SESSION = int(os.getenv("RECORDER_MAX_PER_SESSION", "3"))
+RECORDER_SWEEP_INTERVAL = 5
 
 logger = logging.getLogger("webrtc_handler")
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 
 # Import for DB recording
 try:
-    from app.db import engine
-    from app.models import Recording
-    from sqlmodel import Session
-    from datetime import datetime
+    from app import crud
     DB_AVAILABLE = True
 except ImportError:
     DB_AVAILABLE = False
 
+class RecorderLimitError(Exception):
+    """RECORDER_MAX_ACTIVE or RECORDER_MAX_PER_SESSION reached"""
+
 # Keep active recorders per key (session_id + role)
 _active_recorders: Dict[str, Dict] = {}
-# Structure: key -> {"pc": RTCPeerConnection, "rec": MediaRecorder, "file": path}
+# Structure: key -> {"pc": RTCPeerConnection, "rec": MediaRecorder, "file": path, "tracks": [...],
+#                    "session_id", "role", "started": monotonic, "idle_since": monotonic or None,
+#                    "live_tracks": int}
+
+# Recorders torn down by the supervisor (not by stop_recording requests)
+_reaped = 0
 
 def _make_key(session_id: str, role: str) -> str:
     return f"{session_id or 'nosess'}::{role}"
 
-async def handle_record_offer(sdp: str, sdp_type: str, session_id: Optional[str], role: str) -> Dict:
+def _check_caps(key: str, session_id: Optional[str]):
+    if key in _active_recorders:
+        return  # re-offer replaces the running recorder
+    if len(_active_recorders) >= RECORDER_MAX_ACTIVE:
+        raise RecorderLimitError(f"{len(_active_recorders)} recorders active")
+    if session_id and sum(1 for e in _active_recorders.values()
+                          if e["session_id"] == session_id) >= RECORDER_MAX_PER_SESSION:
+        raise RecorderLimitError(f"session {session_id} has {RECORDER_MAX_PER_SESSION} recorders")
+
+async def handle_record_offer(sdp: str, sdp_type: str, session_id: Optional[str], role: str,
+                              track_roles: Optional[Dict[str, str]] = None) -> Dict:
     """
     Create an aiortc RTCPeerConnection, set remote description from the client's offer,
     create an answer and start MediaRecorder to local file. Returns {'sdp': answer_sdp, 'type': 'answer'}.
+    With role="session" (recording_pool.SESSION_ROLE) the offer carries both legs of the call and track_roles maps
+    each transceiver mid to "caller"/"agent"; all tracks go into one two-track file.
     """
     key = _make_key(session_id, role)
+    _check_caps(key, session_id)
     # cleanup if exists
     await stop_recording(session_id, role)
 
     pc = RTCPeerConnection()
+    # Idle until the peer connection is up; the supervisor reaps it if that never happens
+    entry = {"pc": pc, "file": None, "tracks": [], "session_id": session_id, "role": role,
+             "started": time.monotonic(), "idle_since": time.monotonic(), "live_tracks": 0}
 
     filename = f"{session_id or uuid.uuid4().hex}_{role}_{uuid.uuid4().hex}.webm"
     filepath = os.path.join(RECORDINGS_DIR, filename)
     # MediaRecorder using file (requires ffmpeg available)
     recorder = MediaRecorder(filepath, format="webm")
+    tracks: List[Dict] = []
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        logger.info("Recorder: connection %s for session=%s role=%s", pc.connectionState, session_id, role)
+        if pc.connectionState == "connected":
+            if entry["live_tracks"]:
+                entry["idle_since"] = None
+        elif entry["idle_since"] is None:
+            entry["idle_since"] = time.monotonic()
 
     @pc.on("track")
     async def on_track(track):
         logger.info("Recorder: received track %s for session=%s role=%s", track.kind, session_id, role)
+        mid = next((t.mid for t in pc.getTransceivers() if t.receiver.track is track), None)
+        track_role = (track_roles or {}).get(mid, role)
+        tracks.append({"index": len(tracks), "kind": track.kind, "role": track_role, "mid": mid})
         await recorder.addTrack(track)
+        entry["live_tracks"] += 1
+        if pc.connectionState == "connected":
+            entry["idle_since"] = None
 
         @track.on("ended")
         async def on_ended():
             logger.info("Recorder: track ended for session=%s role=%s", session_id, role)
-            # track ended - nothing immediate here; recorder will be closed on stop_recording or pc close
-
-    # set remote offer
-    offer = RTCSessionDescription(sdp, sdp_type)
-    await pc.setRemoteDescription(offer)
-    # create answer
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
+            entry["live_tracks"] -= 1
+            if entry["live_tracks"] <= 0 and entry["idle_since"] is None:
+                entry["idle_since"] = time.monotonic()
 
-    # start recorder
-    await recorder.start()
+    try:
+        # set remote offer
+        offer = RTCSessionDescription(sdp, sdp_type)
+        await pc.setRemoteDescription(offer)
+        # create answer
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+
+        # start recorder
+        await recorder.start()
+    except Exception:
+        # Not registered yet, so nothing else would ever close these
+        try:
+            await recorder.stop()
+        finally:
+            await pc.close()
+        raise
 
     # save to active recorders
-    _active_recorders[key] = {"pc": pc, "rec": recorder, "file": filepath}
+    entry.update({"rec": recorder, "file": filepath, "tracks": tracks})
+    _active_recorders[key] = entry
     logger.info("Recorder started for key=%s file=%s", key, filepath)
 
     return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
@@ -81,6 +140,7 @@ async def stop_recording(session_id: Optional[str], role: str) -> Optional[Dict]
     pc: RTCPeerConnection = entry.get("pc")
     rec: MediaRecorder = entry.get("rec")
     filepath: str = entry.get("file")
+    tracks: List[Dict] = entry.get("tracks", [])
     try:
         # stop recorder first
         if rec:
@@ -102,17 +162,60 @@ async def stop_recording(session_id: Optional[str], role: str) -> Optional[Dict]
     # Save to DB
     if DB_AVAILABLE and session_id:
         try:
-            with Session(engine) as db:
-                recording = Recording(
-                    session_id=session_id,
-                    role=role,
-                    file_path=filepath,
-                    size=file_size
-                )
-                db.add(recording)
-                db.commit()
-                logger.info("Recording saved to DB: session=%s role=%s", session_id, role)
+            await crud.save_recording(session_id, role, filepath, file_size, json.dumps(tracks))
+            logger.info("Recording saved to DB: session=%s role=%s", session_id, role)
         except Exception:
             logger.exception("Failed to save recording to DB")
 
-    return {"file": filepath, "size": file_size}
\ No newline at end of file
+    return {"file": filepath, "size": file_size, "tracks": tracks}
+
+# Supervisor: tears down recorders whose browser went away without /api/record/stop
+
+async def supervise(on_reaped: Optional[Callable[[Optional[str], str], None]] = None,
+                    interval: float = RECORDER_SWEEP_INTERVAL):
+    """Run forever, reaping idle/failed/overlong recorders; on_reaped(session_id, role) after each"""
+    global _reaped
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        for key, entry in list(_active_recorders.items()):
+            idle_since = entry["idle_since"]
+            failed = entry["pc"].connectionState in ("failed", "closed")
+            idle = idle_since is not None and now - idle_since > RECORDER_IDLE_TIMEOUT
+            overlong = RECORDER_MAX_DURATION > 0 and now - entry["started"] > RECORDER_MAX_DURATION
+            if not (failed or idle or overlong):
+                continue
+            logger.warning("Reaping recorder key=%s (failed=%s idle=%s overlong=%s)", key, failed, idle, overlong)
+            try:
+                await stop_recording(entry["session_id"], entry["role"])
+            except Exception:
+                logger.exception("Failed to reap recorder key=%s", key)
+                _active_recorders.pop(key, None)
+            _reaped += 1
+            if on_reaped:
+                on_reaped(entry["session_id"], entry["role"])
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak RSS; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _open_fds() -> Optional[int]:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+def recorder_stats() -> Dict:
+    """Live recorder counts plus this process' memory and file descriptor use"""
+    states: Dict[str, int] = {}
+    idle = 0
+    for entry in _active_recorders.values():
+        state = entry["pc"].connectionState
+        states[state] = states.get(state, 0) + 1
+        idle += entry["idle_since"] is not None
+    return {"pid": os.getpid(), "active": len(_active_recorders), "idle": idle, "states": states,
+            "reaped": _reaped, "rss_bytes": _rss_bytes(), "open_fds": _open_fds()}
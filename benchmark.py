@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark: starts app.main:app in this process (uvicorn on a
+free localhost port) against a throwaway SQLite file and a local Redis, then
+runs N callers and M agents through the real call flow:
+
+    caller: /ws connect -> /api/call/notify -> (offer) -> answer + ICE -> /api/call/end
+    agent:  call_added event -> /api/call/respond -> offer + ICE -> call_ended
+
+Relay latencies are measured end to end (sender timestamp in the frame, read
+by the receiving socket). Prints a JSON report with throughput and
+p50/p95/p99 per step; --output also writes it to a file.
+
+    python benchmark.py --callers 50 --agents 10 --calls 4 --output bench.json
+
+Redis: --redis-url to use a running server; otherwise a redis-server from PATH
+is started on a free port, or fakeredis (pip install "fakeredis[lua]") is used.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import shutil
+import asyncio
+import argparse
+import tempfile
+import platform
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_redis(url: Optional[str]):
+    """Returns (redis_url, stop callable, description)"""
+    if url:
+        return url, lambda: None, url
+    binary = shutil.which("redis-server")
+    if binary:
+        port = _free_port()
+        proc = subprocess.Popen([binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        def stop():
+            proc.terminate()
+            proc.wait(5)
+        return f"redis://127.0.0.1:{port}/0", stop, "redis-server"
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("No Redis available: pass --redis-url, put redis-server on PATH "
+                 "or pip install 'fakeredis[lua]'")
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+    redis.asyncio.Redis.from_url = classmethod(
+        lambda cls, _url, **kwargs: fakeredis.aioredis.FakeRedis(server=server, **kwargs))
+    return "redis://fakeredis", lambda: None, "fakeredis"
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+class Recorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def add(self, step: str, seconds: float):
+        self.samples[step].append(seconds * 1000)
+
+    def error(self, step: str):
+        self.errors[step] += 1
+
+    def report(self, elapsed: float) -> Dict:
+        steps = {}
+        for step in sorted(set(self.samples) | set(self.errors)):
+            values = sorted(self.samples.get(step, []))
+            steps[step] = {
+                "count": len(values),
+                "errors": self.errors.get(step, 0),
+                "rate_per_s": round(len(values) / elapsed, 2) if elapsed else 0,
+                "mean_ms": round(sum(values) / len(values), 3) if values else 0,
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3),
+                "p99_ms": round(percentile(values, 99), 3),
+                "max_ms": round(values[-1], 3) if values else 0,
+            }
+        return steps
+
+def stamp() -> str:
+    return f"bench:{time.perf_counter()}"
+
+def since_stamp(value: str) -> float:
+    return time.perf_counter() - float(value.split(":", 1)[1])
+
+async def send_candidates(ws, session_id: str, count: int):
+    """count trickled candidates, then the null end-of-candidates marker"""
+    for _ in range(count):
+        await ws.send(json.dumps({"type": "ice_candidate", "target": session_id,
+                                  "candidate": {"candidate": stamp()}}))
+    await ws.send(json.dumps({"type": "ice_candidate", "target": session_id, "candidate": None}))
+
+def receive_candidates(frame: Dict, rec: Recorder) -> int:
+    """Record relay latency of an ice_candidate / ice_candidates frame, returns candidates in it"""
+    if frame["type"] == "ice_candidate":
+        candidates = [frame["candidate"]]
+    elif frame["type"] == "ice_candidates":
+        candidates = frame["candidates"]
+    else:
+        return 0
+    rec.counters["ice_frames_received"] += 1
+    for candidate in candidates:
+        rec.add("ice_relay", since_stamp(candidate["candidate"]))
+    return len(candidates)
+
+class Agent:
+    """Admin tab: takes queued calls one at a time and plays the callee side"""
+
+    def __init__(self, index: int, base: str, ws_base: str, token: str, http, rec: Recorder,
+                 notify_times: Dict[str, float], ice: int, calls: asyncio.Queue):
+        self.client_id = f"agent_bench{index}"
+        self.base, self.ws_base, self.token = base, ws_base, token
+        self.http, self.rec, self.notify_times, self.ice = http, rec, notify_times, ice
+        # Shared by all agents, fed by agent 0; every agent still times its own event fanout
+        self.calls = calls
+        self.feeds_queue = index == 0
+        self.frames: Optional[asyncio.Queue] = None
+        self.ws = None
+
+    async def run(self, stop: asyncio.Event):
+        import websockets
+        self.ws = await websockets.connect(f"{self.ws_base}/ws/{self.client_id}?token={self.token}",
+                                           max_queue=None)
+        worker = asyncio.create_task(self.work())
+        try:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(self.ws.recv(), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                frame = json.loads(raw)
+                if frame.get("type") == "ping":
+                    await self.ws.send(json.dumps({"type": "pong"}))
+                elif frame.get("type") == "call_event":
+                    if frame["event"] == "call_added":
+                        session_id = frame["call"]["session_id"]
+                        sent = self.notify_times.get(session_id)
+                        if sent is not None:
+                            self.rec.add("event_fanout", time.perf_counter() - sent)
+                        if self.feeds_queue:
+                            self.calls.put_nowait(session_id)
+                elif self.frames is not None:
+                    self.frames.put_nowait(frame)
+        finally:
+            worker.cancel()
+            await self.ws.close()
+
+    async def work(self):
+        while True:
+            await self.take_call(await self.calls.get())
+
+    async def take_call(self, session_id: str):
+        try:
+            self.frames = asyncio.Queue()
+            t0 = time.perf_counter()
+            resp = await self.http.post(f"{self.base}/api/call/respond",
+                                        json={"session_id": session_id, "action": "accept",
+                                              "agent_id": self.client_id},
+                                        headers={"Authorization": f"Bearer {self.token}"})
+            if resp.status_code == 409:
+                self.rec.counters["respond_conflicts"] += 1
+                return
+            if resp.status_code != 200:
+                self.rec.error("respond")
+                return
+            self.rec.add("respond", time.perf_counter() - t0)
+
+            await self.ws.send(json.dumps({"type": "offer", "target": session_id, "sdp": stamp()}))
+            while True:
+                frame = await asyncio.wait_for(self.frames.get(), 30)
+                if frame["type"] == "answer":
+                    self.rec.add("answer_relay", since_stamp(frame["sdp"]))
+                    await send_candidates(self.ws, session_id, self.ice)
+                elif frame["type"] == "call_ended":
+                    return
+                else:
+                    receive_candidates(frame, self.rec)
+        except asyncio.TimeoutError:
+            self.rec.error("agent_call")
+        finally:
+            self.frames = None
+
+async def run_caller(index: int, calls: int, base: str, ws_base: str, http, rec: Recorder,
+                     notify_times: Dict[str, float], ice: int, talk_time: float, done: List[int]):
+    import websockets
+    for n in range(calls):
+        client_id = f"caller_bench{index}x{n}"
+        session_id = uuid.uuid4().hex
+        t0 = time.perf_counter()
+        try:
+            ws = await websockets.connect(f"{ws_base}/ws/{client_id}", max_queue=None)
+        except Exception:
+            rec.error("ws_connect")
+            continue
+        rec.add("ws_connect", time.perf_counter() - t0)
+        try:
+            await ws.send(json.dumps({"type": "join_session", "session_id": session_id}))
+            notify_times[session_id] = t0 = time.perf_counter()
+            resp = await http.post(f"{base}/api/call/notify", json={
+                "caller_name": f"Bench {index}", "caller_id": client_id, "session_id": session_id})
+            if resp.status_code != 200:
+                rec.error("notify")
+                continue
+            rec.add("notify", time.perf_counter() - t0)
+
+            received_ice = 0
+            while received_ice < ice or ice == 0:
+                frame = json.loads(await asyncio.wait_for(ws.recv(), 30))
+                if frame["type"] == "offer":
+                    rec.add("offer_relay", since_stamp(frame["sdp"]))
+                    rec.add("ring_to_offer", time.perf_counter() - notify_times[session_id])
+                    await ws.send(json.dumps({"type": "answer", "target": session_id, "sdp": stamp()}))
+                    await send_candidates(ws, session_id, ice)
+                    if ice == 0:
+                        break
+                else:
+                    received_ice += receive_candidates(frame, rec)
+
+            if talk_time:
+                await asyncio.sleep(talk_time)
+            t0 = time.perf_counter()
+            resp = await http.post(f"{base}/api/call/end", json={"session_id": session_id})
+            if resp.status_code != 200:
+                rec.error("end")
+                continue
+            rec.add("end", time.perf_counter() - t0)
+            done[0] += 1
+        except asyncio.TimeoutError:
+            rec.error("caller_call")
+        finally:
+            notify_times.pop(session_id, None)
+            await ws.close()
+
+async def main(args):
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    redis_url, stop_redis, redis_kind = start_redis(args.redis_url)
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir}/bench.db",
+        "REDIS_URL": redis_url,
+        "SIGNALING_BACKEND": "local",
+        "RATE_LIMIT_ENABLED": "0",
+        "CALL_QUOTA_LIMIT": str(10 ** 9),
+        "TELEGRAM_BOT_TOKEN": "",
+        "RECORDING_ENABLED": "0",
+        "ICE_BATCH_WINDOW_MS": str(args.ice_batch_ms),
+        "RETENTION_ENABLED": "0",
+        "RECORDINGS_DIR": os.path.join(workdir, "recordings"),
+        "ADMIN_USER": "bench",
+        "ADMIN_PASS": uuid.uuid4().hex,
+    })
+
+    import httpx
+    import uvicorn
+    from app.main import app, redis_client
+    from app.auth import create_access_token
+
+    await redis_client.flushdb()
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           lifespan="on", ws_max_size=1 << 20))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+
+    base, ws_base = f"http://127.0.0.1:{port}", f"ws://127.0.0.1:{port}"
+    token = create_access_token("bench")
+    rec = Recorder()
+    notify_times: Dict[str, float] = {}
+    done = [0]
+    limits = httpx.Limits(max_connections=args.callers + args.agents + 10)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=30) as http:
+            stop = asyncio.Event()
+            calls: asyncio.Queue = asyncio.Queue()
+            agents = [Agent(i, base, ws_base, token, http, rec, notify_times, args.ice, calls)
+                      for i in range(args.agents)]
+            agent_tasks = [asyncio.create_task(agent.run(stop)) for agent in agents]
+            await asyncio.sleep(0.5)  # let agent sockets connect
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_caller(i, args.calls, base, ws_base, http, rec, notify_times,
+                                              args.ice, args.talk_time, done)
+                                   for i in range(args.callers)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await asyncio.gather(*agent_tasks, return_exceptions=True)
+    finally:
+        server.should_exit = True
+        await server_task
+        stop_redis()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    attempted = args.callers * args.calls
+    return {
+        "benchmark": "call_flow",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "redis": redis_kind,
+        "config": {"callers": args.callers, "agents": args.agents, "calls_per_caller": args.calls,
+                   "ice_candidates": args.ice, "ice_batch_ms": args.ice_batch_ms,
+                   "talk_time": args.talk_time},
+        "duration_s": round(elapsed, 3),
+        "calls": {"attempted": attempted, "completed": done[0], "failed": attempted - done[0]},
+        "throughput_calls_per_s": round(done[0] / elapsed, 2) if elapsed else 0,
+        "counters": dict(rec.counters),
+        "steps": rec.report(elapsed),
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Call flow load benchmark")
+    parser.add_argument("--callers", type=int, default=20, help="concurrent callers")
+    parser.add_argument("--agents", type=int, default=5, help="connected agents")
+    parser.add_argument("--calls", type=int, default=5, help="sequential calls per caller")
+    parser.add_argument("--ice", type=int, default=4, help="ICE candidates sent by each side")
+    parser.add_argument("--ice-batch-ms", type=float, default=0, help="server ICE_BATCH_WINDOW_MS")
+    parser.add_argument("--talk-time", type=float, default=0, help="seconds between connect and hang up")
+    parser.add_argument("--redis-url", help="use this Redis instead of starting one")
+    parser.add_argument("--database-url", help="default: SQLite file in a temp dir")
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
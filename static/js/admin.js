@@ -1,21 +1,55 @@
 let ws, pc, localStream, pcRecordAgent;
 let currentUsername = '', agentId = '', currentSessionId = '';
 let callStartTime = null, durationInterval = null, isIntercomMode = false;
+// Call lists kept in sync by server-pushed call_event deltas
+let pendingCalls = new Map(), historyCalls = [], lastSeq = 0;
+const HISTORY_SIZE = 20;
+// Signaling resume: last signal_seq seen, frames queued while reconnecting
+let signalSeq = 0, outbox = [], closing = false, droppedAt = null;
 
 const ICE_SERVERS = [{ urls: 'stun:stun.l.google.com:19302' }];
+// Reconnect backoff doubles from RECONNECT_DELAY up to RECONNECT_MAX (RESUME_RETRY_MAX
+// during a call, so it still resumes within the server's grace period)
+const RECONNECT_DELAY = 1000, RECONNECT_MAX = 30000, RESUME_RETRY_MAX = 4000, RESUME_TIMEOUT = 20000;
+let reconnectAttempts = 0;
 
-async function startServerRecordingAgent(stream, session_id) {
+function authHeaders(extra = {}) {
+  return { ...extra, 'Authorization': 'Bearer ' + localStorage.getItem('token') };
+}
+
+// Token expired or revoked (HTTP 401, WebSocket close 1008): drop it and show the login
+function backToLogin() {
+  cleanup();
+  localStorage.removeItem('token');
+  location.reload();
+}
+
+// Jittered, so tabs dropped by a restart do not all reconnect at the same moment
+function reconnectDelay() {
+  const cap = currentSessionId ? RESUME_RETRY_MAX : RECONNECT_MAX;
+  const delay = Math.min(cap, RECONNECT_DELAY * 2 ** reconnectAttempts++);
+  return delay / 2 + Math.random() * delay / 2;
+}
+
+// One recording connection per call: the agent sends its own and the caller's
+// tracks, the server writes them into a single file (tracks: mid -> role)
+async function startServerRecordingAgent(localStream, remoteStream, session_id) {
   pcRecordAgent = new RTCPeerConnection({ iceServers: ICE_SERVERS });
-  stream.getTracks().forEach(t => pcRecordAgent.addTrack(t, stream));
+  const roles = new Map();
+  localStream.getAudioTracks().forEach(t => roles.set(pcRecordAgent.addTransceiver(t, { direction: 'sendonly', streams: [localStream] }), 'agent'));
+  remoteStream.getAudioTracks().forEach(t => roles.set(pcRecordAgent.addTransceiver(t, { direction: 'sendonly', streams: [remoteStream] }), 'caller'));
   const offer = await pcRecordAgent.createOffer();
   await pcRecordAgent.setLocalDescription(offer);
+  const tracks = {};
+  roles.forEach((role, transceiver) => tracks[transceiver.mid] = role);
   const res = await fetch('/api/record/offer', {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ sdp: offer.sdp, type: offer.type, session_id, role: 'agent' })
+    headers: authHeaders({ 'Content-Type': 'application/json' }),
+    body: JSON.stringify({ sdp: offer.sdp, type: offer.type, session_id, role: 'session', tracks })
   });
   if (res.ok) {
     const ans = await res.json();
+    if (ans.disabled) return pcRecordAgent.close();
     await pcRecordAgent.setRemoteDescription({ type: ans.type, sdp: ans.sdp });
   }
 }
@@ -24,8 +58,8 @@ async function stopServerRecordingAgent(session_id) {
   try {
     await fetch('/api/record/stop', {
       method: 'POST',
-      headers: {'Content-Type':'application/json'},
-      body: JSON.stringify({ session_id, role: 'agent' })
+      headers: authHeaders({ 'Content-Type': 'application/json' }),
+      body: JSON.stringify({ session_id, role: 'session' })
     });
   } catch (e) {}
 }
@@ -92,24 +126,61 @@ verifyOtpBtn.onclick = async () => {
 
 async function initAdmin() {
   agentId = 'agent_' + Date.now();
-  await loadPendingCalls();
-  await loadCallHistory();
-  setInterval(async () => {
-    await loadPendingCalls();
-    await loadCallHistory();
-  }, 5000);
-  
-  ws = new WebSocket(`ws://${location.host}/ws/${agentId}`);
-  ws.onopen = () => ws.send(JSON.stringify({ type: 'agent_ready', agent_id: agentId }));
+  await loadCallLists();
+  connectSignaling(false);
+}
+
+// Reconnects after a drop; ?last_seq= replays missed call signaling, resync the call lists
+function connectSignaling(resume) {
+  const token = encodeURIComponent(localStorage.getItem('token'));
+  ws = new WebSocket(`ws://${location.host}/ws/${agentId}?token=${token}` + (resume ? `&last_seq=${signalSeq}` : ''));
+  ws.onopen = () => {
+    droppedAt = null;
+    reconnectAttempts = 0;
+    ws.send(JSON.stringify({ type: 'agent_ready', agent_id: agentId }));
+    ws.send(JSON.stringify({ type: 'resync', last_seq: lastSeq }));
+    outbox.splice(0).forEach(m => ws.send(m));
+  };
+  ws.onclose = (evt) => {
+    if (closing) return;
+    if (evt.code === 1008) return backToLogin();
+    droppedAt = droppedAt || Date.now();
+    // Idle tabs retry forever, a call is given up once the server has dropped it
+    if (currentSessionId && Date.now() - droppedAt > RESUME_TIMEOUT) {
+      cleanup();
+      return location.reload();
+    }
+    setTimeout(() => connectSignaling(true), reconnectDelay());
+  };
   ws.onmessage = async (evt) => {
     const msg = JSON.parse(evt.data);
-    if (msg.type === 'pending_update') {
-      await loadPendingCalls();
-      if (activeCallDiv.style.display !== 'none') showNotification('Yeni çağrı bekleniyor!');
+    if (msg.signal_seq) signalSeq = msg.signal_seq;
+    if (msg.type === 'ping') {
+      // Server heartbeat, silent sockets are reaped
+      ws.send(JSON.stringify({ type: 'pong' }));
+    } else if (msg.type === 'resume_failed') {
+      if (currentSessionId) {
+        cleanup();
+        location.reload();
+      }
+    } else if (msg.type === 'call_event') {
+      // Older than the lists: a duplicate, or the sequence restarted (Redis flushed);
+      // resync answers the latter with reset
+      if (msg.seq <= lastSeq) {
+        if (msg.seq < lastSeq) ws.send(JSON.stringify({ type: 'resync', last_seq: lastSeq }));
+        return;
+      }
+      if (msg.seq > lastSeq + 1) return ws.send(JSON.stringify({ type: 'resync', last_seq: lastSeq }));
+      applyCallEvent(msg);
+    } else if (msg.type === 'call_events') {
+      if (msg.reset) await loadCallLists();
+      else msg.events.filter(e => e.seq > lastSeq).forEach(applyCallEvent);
     } else if (msg.type === 'answer' && pc) {
       await pc.setRemoteDescription({ type: 'answer', sdp: msg.sdp });
     } else if (msg.type === 'ice_candidate' && pc) {
       await pc.addIceCandidate(new RTCIceCandidate(msg.candidate));
+    } else if (msg.type === 'ice_candidates' && pc) {
+      for (const candidate of msg.candidates) await pc.addIceCandidate(new RTCIceCandidate(candidate));
     } else if (msg.type === 'call_ended') {
       cleanup();
       location.reload();
@@ -117,10 +188,44 @@ async function initAdmin() {
   };
 }
 
+function signal(msg) {
+  const data = JSON.stringify(msg);
+  if (ws && ws.readyState === WebSocket.OPEN) ws.send(data);
+  else outbox.push(data);
+}
+
+async function loadCallLists() {
+  const [pendingSeq, historySeq] = [await loadPendingCalls(), await loadCallHistory()];
+  // Replaying from the older snapshot is safe, events are applied idempotently
+  lastSeq = Math.min(pendingSeq, historySeq);
+}
+
+function applyCallEvent(evt) {
+  lastSeq = evt.seq;
+  const call = evt.call;
+  if (evt.event === 'call_added') {
+    pendingCalls.set(call.session_id, call);
+    if (activeCallDiv.style.display !== 'none') showNotification('Yeni çağrı bekleniyor!');
+  } else {
+    pendingCalls.delete(call.session_id);
+    historyCalls = [call, ...historyCalls.filter(c => c.session_id !== call.session_id)].slice(0, HISTORY_SIZE);
+    renderCallHistory();
+  }
+  renderPendingCalls();
+}
+
 async function loadPendingCalls() {
-  const res = await fetch('/api/calls/pending');
-  if (!res.ok) return;
+  const res = await fetch('/api/calls/pending', { headers: authHeaders() });
+  if (res.status === 401) backToLogin();
+  if (!res.ok) return lastSeq;
   const calls = await res.json();
+  pendingCalls = new Map(calls.map(c => [c.session_id, c]));
+  renderPendingCalls();
+  return Number(res.headers.get('X-Event-Seq') || 0);
+}
+
+function renderPendingCalls() {
+  const calls = [...pendingCalls.values()].sort((a, b) => b.start_time.localeCompare(a.start_time));
   pendingCountSpan.textContent = calls.length;
   pendingCallsDiv.innerHTML = '';
   calls.forEach(call => {
@@ -141,11 +246,17 @@ async function loadPendingCalls() {
 }
 
 async function loadCallHistory() {
-  const res = await fetch('/api/calls/history?limit=20');
-  if (!res.ok) return;
-  const calls = await res.json();
+  const res = await fetch(`/api/calls/history?limit=${HISTORY_SIZE}`, { headers: authHeaders() });
+  if (res.status === 401) backToLogin();
+  if (!res.ok) return lastSeq;
+  historyCalls = await res.json();
+  renderCallHistory();
+  return Number(res.headers.get('X-Event-Seq') || 0);
+}
+
+function renderCallHistory() {
   callHistoryDiv.innerHTML = '';
-  calls.filter(c => c.status !== 'pending').forEach(call => {
+  historyCalls.filter(c => c.status !== 'pending').forEach(call => {
     const div = document.createElement('div');
     div.className = 'call-item';
     const duration = call.duration ? `${Math.floor(call.duration / 60)}:${(call.duration % 60).toString().padStart(2, '0')}` : '-';
@@ -160,12 +271,17 @@ async function loadCallHistory() {
 }
 
 window.acceptCall = async (sessionId, callerName) => {
-  currentSessionId = sessionId;
-  await fetch('/api/call/respond', {
+  const res = await fetch('/api/call/respond', {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: authHeaders({ 'Content-Type': 'application/json' }),
     body: JSON.stringify({ session_id: sessionId, action: 'accept', agent_id: agentId })
   });
+  if (res.status === 401) return backToLogin();
+  if (!res.ok) {
+    // 409: another agent claimed it first, 429: daily limit
+    return showNotification(res.status === 409 ? 'Çağrı başka bir temsilci tarafından alındı' : 'Çağrı kabul edilemedi');
+  }
+  currentSessionId = sessionId;
   document.getElementById('callsSection').style.display = 'none';
   activeCallDiv.style.display = 'block';
   callerNameDisplay.textContent = callerName;
@@ -178,24 +294,26 @@ window.acceptCall = async (sessionId, callerName) => {
   }
   pc = new RTCPeerConnection({ iceServers: ICE_SERVERS });
   localStream.getTracks().forEach(t => pc.addTrack(t, localStream));
-  pc.ontrack = (evt) => remoteVideo.srcObject = evt.streams[0];
+  pc.ontrack = (evt) => {
+    remoteVideo.srcObject = evt.streams[0];
+    if (!pcRecordAgent && evt.track.kind === 'audio') startServerRecordingAgent(localStream, evt.streams[0], sessionId);
+  };
   pc.onicecandidate = (evt) => {
-    if (evt.candidate) ws.send(JSON.stringify({ type: 'ice_candidate', candidate: evt.candidate, target: sessionId }));
+    // null = gathering finished, lets the server flush its candidate batch
+    signal({ type: 'ice_candidate', candidate: evt.candidate, target: sessionId });
   };
   const offer = await pc.createOffer();
   await pc.setLocalDescription(offer);
-  ws.send(JSON.stringify({ type: 'offer', sdp: offer.sdp, target: sessionId }));
-  await startServerRecordingAgent(localStream, sessionId);
+  signal({ type: 'offer', sdp: offer.sdp, target: sessionId });
   startCallTimer();
 };
 
 window.rejectCall = async (sessionId) => {
   await fetch('/api/call/respond', {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: authHeaders({ 'Content-Type': 'application/json' }),
     body: JSON.stringify({ session_id: sessionId, action: 'reject' })
   });
-  await loadPendingCalls();
 };
 
 toggleAudioBtn.onclick = () => {
@@ -277,6 +395,7 @@ function startCallTimer() {
 }
 
 function cleanup() {
+  closing = true;
   if (durationInterval) clearInterval(durationInterval);
   if (pc) pc.close();
   if (pcRecordAgent) pcRecordAgent.close();
@@ -1,33 +1,18 @@
-let ws, pc, localStream, pcRecord;
+let ws, pc, localStream;
 let callerName = '', callerId = '', sessionId = '';
 let callStartTime = null, durationInterval = null, isIntercomMode = false;
+// Signaling resume: last signal_seq seen, frames queued while reconnecting
+let signalSeq = 0, outbox = [], closing = false, droppedAt = null;
 
 const ICE_SERVERS = [{ urls: 'stun:stun.l.google.com:19302' }];
+// Reconnect backoff doubles up to RECONNECT_MAX, jittered so callers dropped by a
+// restart do not all reconnect at the same moment
+const RECONNECT_DELAY = 1000, RECONNECT_MAX = 4000, RESUME_TIMEOUT = 20000;
+let reconnectAttempts = 0;
 
-async function startServerRecording(stream, session_id) {
-  pcRecord = new RTCPeerConnection({ iceServers: ICE_SERVERS });
-  stream.getTracks().forEach(t => pcRecord.addTrack(t, stream));
-  const offer = await pcRecord.createOffer();
-  await pcRecord.setLocalDescription(offer);
-  const res = await fetch('/api/record/offer', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ sdp: offer.sdp, type: offer.type, session_id, role: 'caller' })
-  });
-  if (res.ok) {
-    const ans = await res.json();
-    await pcRecord.setRemoteDescription({ type: ans.type, sdp: ans.sdp });
-  }
-}
-
-async function stopServerRecording(session_id) {
-  try {
-    await fetch('/api/record/stop', {
-      method: 'POST',
-      headers: {'Content-Type':'application/json'},
-      body: JSON.stringify({ session_id, role: 'caller' })
-    });
-  } catch (e) {}
+function reconnectDelay() {
+  const delay = Math.min(RECONNECT_MAX, RECONNECT_DELAY * 2 ** reconnectAttempts++);
+  return delay / 2 + Math.random() * delay / 2;
 }
 
 const nameScreen = document.getElementById('nameScreen');
@@ -64,45 +49,81 @@ callBtn.onclick = async () => {
     return alert('Medya erişimi reddedildi');
   }
   
-  ws = new WebSocket(`ws://${location.host}/ws/${callerId}`);
-  
+  connectSignaling(false);
+};
+
+// Open the signaling socket; after a drop it reconnects with ?last_seq= and the
+// server replays what was missed, so a network blip does not end the call
+function connectSignaling(resume) {
+  ws = new WebSocket(`ws://${location.host}/ws/${callerId}` + (resume ? `?last_seq=${signalSeq}` : ''));
+
   ws.onopen = async () => {
+    droppedAt = null;
+    reconnectAttempts = 0;
+    if (resume) {
+      outbox.splice(0).forEach(m => ws.send(m));
+      return;
+    }
     await fetch('/api/call/notify', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify({ caller_name: callerName, caller_id: callerId, session_id: sessionId })
     });
-    ws.send(JSON.stringify({ type: 'join_session', session_id: sessionId }));
+    signal({ type: 'join_session', session_id: sessionId });
   };
-  
+
   ws.onmessage = async (evt) => {
     const msg = JSON.parse(evt.data);
-    if (msg.type === 'offer') {
+    if (msg.signal_seq) signalSeq = msg.signal_seq;
+    if (msg.type === 'ping') {
+      // Server heartbeat, silent sockets are reaped
+      ws.send(JSON.stringify({ type: 'pong' }));
+    } else if (msg.type === 'resume_failed') {
+      cleanup();
+      location.reload();
+    } else if (msg.type === 'offer') {
+      // Recording is per call and started from the agent side
       await handleOffer(msg.sdp);
-      await startServerRecording(localStream, sessionId);
       startCallTimer();
     } else if (msg.type === 'ice_candidate' && pc) {
       await pc.addIceCandidate(new RTCIceCandidate(msg.candidate));
+    } else if (msg.type === 'ice_candidates' && pc) {
+      for (const candidate of msg.candidates) await pc.addIceCandidate(new RTCIceCandidate(candidate));
     } else if (msg.type === 'call_ended') {
       cleanup();
       location.reload();
     }
   };
-  
-  ws.onclose = () => cleanup();
-};
+
+  ws.onclose = () => {
+    if (closing) return;
+    droppedAt = droppedAt || Date.now();
+    if (Date.now() - droppedAt > RESUME_TIMEOUT) {
+      cleanup();
+      return location.reload();
+    }
+    setTimeout(() => connectSignaling(true), reconnectDelay());
+  };
+}
+
+function signal(msg) {
+  const data = JSON.stringify(msg);
+  if (ws && ws.readyState === WebSocket.OPEN) ws.send(data);
+  else outbox.push(data);
+}
 
 async function handleOffer(sdp) {
   pc = new RTCPeerConnection({ iceServers: ICE_SERVERS });
   localStream.getTracks().forEach(t => pc.addTrack(t, localStream));
   pc.ontrack = (evt) => remoteVideo.srcObject = evt.streams[0];
   pc.onicecandidate = (evt) => {
-    if (evt.candidate) ws.send(JSON.stringify({ type: 'ice_candidate', candidate: evt.candidate, target: sessionId }));
+    // null = gathering finished, lets the server flush its candidate batch
+    signal({ type: 'ice_candidate', candidate: evt.candidate, target: sessionId });
   };
   await pc.setRemoteDescription({ type: 'offer', sdp });
   const answer = await pc.createAnswer();
   await pc.setLocalDescription(answer);
-  ws.send(JSON.stringify({ type: 'answer', sdp: answer.sdp, target: sessionId }));
+  signal({ type: 'answer', sdp: answer.sdp, target: sessionId });
 }
 
 toggleAudioBtn.onclick = () => {
@@ -163,7 +184,6 @@ fullscreenBtn.onclick = () => {
 };
 
 hangupBtn.onclick = async () => {
-  await stopServerRecording(sessionId);
   await fetch('/api/call/end', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
@@ -184,9 +204,9 @@ function startCallTimer() {
 }
 
 function cleanup() {
+  closing = true;
   if (durationInterval) clearInterval(durationInterval);
   if (pc) pc.close();
-  if (pcRecord) pcRecord.close();
   if (ws) ws.close();
   if (localStream) localStream.getTracks().forEach(t => t.stop());
 }
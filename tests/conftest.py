@@ -0,0 +1,27 @@
+"""
+Shared fixtures: a throwaway SQLite database and fakeredis (with Lua, pip
+install "fakeredis[lua]") standing in for Redis, so the scripts run for real.
+"""
+import os
+import sys
+import tempfile
+
+# Before any app module creates its engine; never an exported database
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='tests-')}/test.db"
+os.environ.pop("DATABASE_READ_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+@pytest.fixture
+def redis_factory():
+    """Returns a function creating clients of one fake server (create them inside the event loop)"""
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+
+@pytest.fixture(scope="session")
+def db():
+    from app.db import init_db
+    init_db()
@@ -0,0 +1,114 @@
+"""TokenAuth cache TTL, LRU eviction and revocation"""
+import time
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import auth
+from app.auth import TokenAuth, create_access_token
+
+class Clock:
+    """Stands in for the time module of app.auth, starting at the real time"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def time(self):
+        return time.time() + self.offset
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth, "time", clock)
+    return clock
+
+class Admins:
+    """load_admin that counts lookups, so cache hits are visible"""
+
+    def __init__(self):
+        self.lookups = []
+
+    async def __call__(self, username):
+        self.lookups.append(username)
+        return username in ("admin", "other")
+
+def test_cached_token_skips_lookup_until_ttl(redis_factory, clock):
+    admins = Admins()
+    token = create_access_token("admin")
+
+    async def scenario():
+        token_auth = TokenAuth(redis_factory(), admins, cache_ttl=60)
+        await token_auth.authenticate(token)
+        await token_auth.authenticate(token)
+        clock.offset += 61
+        return await token_auth.authenticate(token)
+
+    assert asyncio.run(scenario()) == "admin"
+    assert admins.lookups == ["admin", "admin"]
+
+def test_cache_ttl_never_outlives_the_token(redis_factory, clock):
+    admins = Admins()
+    token = create_access_token("admin", expires_delta=5)
+
+    async def scenario():
+        token_auth = TokenAuth(redis_factory(), admins, cache_ttl=60)
+        await token_auth.authenticate(token)
+        return token_auth._cache[token][2] - clock.monotonic()
+
+    assert asyncio.run(scenario()) <= 5
+
+def test_cache_evicts_least_recently_used(redis_factory, clock):
+    admins = Admins()
+    first, second, third = (create_access_token(user) for user in ("admin", "other", "admin"))
+
+    async def scenario():
+        token_auth = TokenAuth(redis_factory(), admins, cache_size=2)
+        await token_auth.authenticate(first)
+        await token_auth.authenticate(second)
+        # first is used again, so second is the one evicted
+        await token_auth.authenticate(first)
+        await token_auth.authenticate(third)
+        return list(token_auth._cache)
+
+    assert asyncio.run(scenario()) == [first, third]
+    assert len(admins.lookups) == 3
+
+def test_revoked_token_is_rejected_while_cached(redis_factory, clock):
+    admins = Admins()
+    token = create_access_token("admin")
+
+    async def scenario():
+        here, elsewhere = TokenAuth(redis_factory(), admins), TokenAuth(redis_factory(), admins)
+        await here.authenticate(token)
+        await elsewhere.authenticate(token)
+        # Logout handled by the other process
+        await elsewhere.revoke(token)
+        with pytest.raises(HTTPException) as revoked_elsewhere:
+            await elsewhere.authenticate(token)
+        clock.offset += auth.AUTH_REVOCATION_REFRESH
+        with pytest.raises(HTTPException) as revoked_here:
+            await here.authenticate(token)
+        return revoked_elsewhere.value, revoked_here.value, await here.authenticate(create_access_token("admin"))
+
+    revoked_elsewhere, revoked_here, fresh = asyncio.run(scenario())
+    assert revoked_elsewhere.status_code == revoked_here.status_code == 401
+    # Only that token: a new login still works
+    assert fresh == "admin"
+
+def test_unknown_user_and_bad_token_are_rejected(redis_factory, clock):
+    async def scenario():
+        token_auth = TokenAuth(redis_factory(), Admins())
+        errors = []
+        for token in (create_access_token("ghost"), "not-a-jwt"):
+            with pytest.raises(HTTPException) as error:
+                await token_auth.authenticate(token)
+            errors.append(error.value.status_code)
+        return errors, token_auth._cache
+
+    errors, cache = asyncio.run(scenario())
+    assert errors == [401, 401]
+    assert not cache
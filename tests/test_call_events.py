@@ -0,0 +1,46 @@
+"""Sequenced call event log"""
+import json
+import asyncio
+
+from app import call_events
+from app.call_events import CallEventLog
+
+def test_call_event_seq_does_not_depend_on_json_spacing(redis_factory, monkeypatch):
+    dumps = json.dumps
+    # Compact output like orjson: no space after ":"
+    monkeypatch.setattr(call_events.json, "dumps", lambda value: dumps(value, separators=(",", ":")))
+
+    async def scenario():
+        log = CallEventLog(redis_factory())
+        frames = [await log.append(call_events.CALL_ADDED, {"session_id": f"s{i}"}) for i in range(3)]
+        return frames, await log.since(1)
+
+    frames, since = asyncio.run(scenario())
+    assert [frame["seq"] for frame in frames] == [1, 2, 3]
+    assert [frame["seq"] for frame in since] == [2, 3]
+
+def test_persisted_generation_versions_lists_without_a_seq_gap(redis_factory):
+    async def scenario():
+        log = CallEventLog(redis_factory())
+        await log.append("call_ended", {"session_id": "s1"})
+        before = await log.versions()
+        await log.mark_persisted()
+        return before, await log.versions()
+
+    before, after = asyncio.run(scenario())
+    assert before != after
+    assert before[0] == after[0] == 1
+
+def test_since_forces_a_reload_after_the_sequence_restarts(redis_factory):
+    async def scenario():
+        log = CallEventLog(redis_factory())
+        for i in range(3):
+            await log.append(call_events.CALL_ADDED, {"session_id": f"s{i}"})
+        # Redis flushed or failed over: the sequence starts again from 1
+        await log.redis.flushall()
+        await log.append(call_events.CALL_ADDED, {"session_id": "s3"})
+        return await log.since(3), await log.since(0)
+
+    ahead, fresh = asyncio.run(scenario())
+    assert ahead is None
+    assert [frame["seq"] for frame in fresh] == [1]
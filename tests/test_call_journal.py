@@ -0,0 +1,74 @@
+"""Call status transitions and the write-behind end journal"""
+import asyncio
+import uuid
+
+import pytest
+
+from app import crud
+from app.call_journal import CallJournal
+
+def _session_id() -> str:
+    return uuid.uuid4().hex
+
+def test_transitions_are_conditional(db):
+    async def scenario():
+        session_id = _session_id()
+        await crud.create_call(session_id, "caller_1", "Test")
+        accepted = await crud.respond_call(session_id, "accept", "agent_1")
+        with pytest.raises(crud.CallTransitionError):
+            await crud.respond_call(session_id, "reject", None)
+        ended = await crud.end_call(session_id)
+        with pytest.raises(crud.CallTransitionError):
+            await crud.end_call(session_id)
+        return accepted, ended, await crud.respond_call(_session_id(), "accept", "agent_1")
+
+    accepted, ended, missing = asyncio.run(scenario())
+    assert accepted.status == "accepted" and accepted.agent_id == "agent_1"
+    assert ended.status == "ended" and ended.duration is not None
+    assert missing is None
+
+def test_journal_writes_ends_and_notifies(db):
+    async def scenario():
+        flushes = []
+
+        async def on_flush():
+            flushes.append(1)
+
+        journal = CallJournal(batch_size=100, interval=60, on_flush=on_flush)
+        await journal.start()
+        session_id = _session_id()
+        await crud.create_call(session_id, "caller_1", "Test")
+        call = await crud.end_call(session_id)
+        journal.record_end(call)
+        # Drained on shutdown even though neither size nor time triggered a flush
+        await journal.stop()
+        rows = await crud.page_calls(crud.HISTORY_COLUMNS, 500, primary=True)
+        return call, next(r for r in rows if r.session_id == session_id), flushes
+
+    call, row, flushes = asyncio.run(scenario())
+    assert row.duration == call.duration
+    assert flushes == [1]
+
+def test_journal_keeps_entries_when_the_write_fails(db, monkeypatch):
+    async def failing(rows):
+        raise RuntimeError("db down")
+
+    async def scenario():
+        journal = CallJournal(batch_size=100, interval=60)
+        session_id = _session_id()
+        await crud.create_call(session_id, "caller_1", "Test")
+        journal.record_end(await crud.end_call(session_id))
+        monkeypatch.setattr(crud, "save_call_ends", failing)
+        await journal.flush()
+        return journal.depth
+
+    assert asyncio.run(scenario()) == 1
+
+def test_call_status_lookup(db):
+    async def scenario():
+        session_id = _session_id()
+        await crud.create_call(session_id, "caller_1", "Test")
+        await crud.respond_call(session_id, "reject", None)
+        return await crud.get_call_status(session_id), await crud.get_call_status(_session_id())
+
+    assert asyncio.run(scenario()) == ("rejected", None)
@@ -0,0 +1,74 @@
+"""Frame codecs, subprotocol negotiation and inbound validation"""
+import pytest
+
+from app import codec
+from app.codec import JSON, FrameError, negotiate, validate
+
+VALID = [
+    {"type": "join_session", "session_id": "s1"},
+    {"type": "agent_ready"},
+    {"type": "agent_ready", "agent_id": "agent_1"},
+    {"type": "resync", "last_seq": 12},
+    {"type": "pong"},
+    {"type": "offer", "target": "agent_1", "sdp": "v=0"},
+    {"type": "answer", "target": "caller_1", "sdp": "v=0"},
+    {"type": "ice_candidate", "target": "agent_1", "candidate": {"candidate": "candidate:1 1 udp", "sdpMid": "0"}},
+    # End of candidates
+    {"type": "ice_candidate", "target": "agent_1", "candidate": None},
+]
+
+@pytest.mark.parametrize("frame", VALID)
+def test_valid_frames(frame):
+    assert validate(frame) == frame["type"]
+
+@pytest.mark.parametrize("frame, detail", [
+    ({"type": "hello"}, "unknown type"),
+    ({"type": 1}, "unknown type"),
+    ({}, "unknown type"),
+    ({"type": "join_session"}, "missing session_id"),
+    ({"type": "join_session", "session_id": None}, "bad session_id"),
+    ({"type": "join_session", "session_id": 7}, "bad session_id"),
+    ({"type": "join_session", "session_id": "s" * (codec.MAX_ID_LENGTH + 1)}, "session_id too long"),
+    ({"type": "resync", "last_seq": "3"}, "bad last_seq"),
+    # bool is an int subclass, still not a sequence number
+    ({"type": "resync", "last_seq": True}, "bad last_seq"),
+    ({"type": "offer", "target": "agent_1"}, "missing sdp"),
+    ({"type": "offer", "target": "agent_1", "sdp": "x" * (codec.MAX_SDP_LENGTH + 1)}, "sdp too long"),
+    ({"type": "ice_candidate", "target": "agent_1"}, "missing candidate"),
+    ({"type": "ice_candidate", "target": "agent_1", "candidate": "candidate:1"}, "bad candidate"),
+    ({"type": "ice_candidate", "target": "agent_1", "candidate": {"sdpMid": "0"}}, "bad candidate"),
+    ({"type": "ice_candidate", "target": "agent_1",
+      "candidate": {"candidate": "c" * (codec.MAX_CANDIDATE_LENGTH + 1)}}, "bad candidate"),
+])
+def test_invalid_frames(frame, detail):
+    with pytest.raises(FrameError) as error:
+        validate(frame)
+    assert str(error.value) == detail
+    assert error.value.kind == "schema"
+
+@pytest.mark.parametrize("data", ["{not json", "[1, 2]", b"\xff\x00", '"text"'])
+def test_undecodable_frames(data):
+    with pytest.raises(FrameError) as error:
+        JSON.decode(data)
+    assert error.value.kind == "decode"
+
+def test_type_only_frames_are_pre_encoded():
+    assert JSON.encode({"type": "ping"}) is JSON.encode({"type": "ping"})
+    assert JSON.decode(JSON.encode({"type": "ping"})) == {"type": "ping"}
+    frame = {"type": "offer", "sdp": "v=0", "signal_seq": 3}
+    assert JSON.decode(JSON.encode(frame)) == frame
+
+def test_negotiate_falls_back_to_json():
+    assert negotiate([]) is JSON
+    assert negotiate(["chat", codec.JSON_SUBPROTOCOL]) is JSON
+
+def test_msgpack_round_trip():
+    if codec.MSGPACK is None:
+        pytest.skip("msgpack not installed")
+    assert negotiate(["chat", codec.MSGPACK_SUBPROTOCOL, codec.JSON_SUBPROTOCOL]) is codec.MSGPACK
+    frame = {"type": "answer", "target": "caller_1", "sdp": "v=0"}
+    data = codec.MSGPACK.encode(frame)
+    assert isinstance(data, bytes)
+    assert codec.MSGPACK.decode(data) == frame
+    # Text frames on a msgpack socket are JSON
+    assert codec.MSGPACK.decode(JSON.encode(frame)) == frame
@@ -0,0 +1,155 @@
+"""SignalingHub send queues, resume and final departure"""
+import json
+import asyncio
+
+from app import hub as hub_module
+from app.hub import SignalingHub
+
+class FakeSocket:
+    def __init__(self, blocked: bool = False):
+        self.frames = []
+        self.closed_with = None
+        self.blocked = blocked
+
+    async def send_text(self, data):
+        if self.blocked:
+            await asyncio.Event().wait()
+        self.frames.append(json.loads(data))
+
+    async def send_bytes(self, data):
+        raise AssertionError("JSON sockets only")
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+    def types(self):
+        return [frame["type"] for frame in self.frames]
+
+class LocalBackend:
+    """Publishes straight back into the hub, like the single-process backend"""
+
+    def __init__(self):
+        self.hub = None
+
+    async def watch_session(self, session_id):
+        pass
+
+    async def unwatch_session(self, session_id):
+        pass
+
+    async def publish_session(self, session_id, frame, role=None, exclude=None):
+        await self.hub.deliver({"session_id": session_id, "frame": frame, "role": role, "exclude": exclude})
+
+def _hub() -> SignalingHub:
+    backend = LocalBackend()
+    backend.hub = SignalingHub(backend)
+    return backend.hub
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def _close(hub: SignalingHub):
+    """Close every socket so no writer task outlives the test loop"""
+    for client_id in list(hub.connections):
+        await hub.connections[client_id].close()
+
+def test_slow_consumer_is_evicted_and_detached(monkeypatch):
+    monkeypatch.setattr(hub_module, "SEND_QUEUE_SIZE", 4)
+
+    async def scenario():
+        hub = _hub()
+        socket = FakeSocket(blocked=True)
+        hub.connect("agent_1", socket)
+        await hub.join("s1", "agent_1")
+        for i in range(8):
+            await hub.deliver({"session_id": "s1", "frame": {"type": "answer", "sdp": str(i)}})
+        await _settle()
+        return hub, socket
+
+    hub, socket = asyncio.run(scenario())
+    assert socket.closed_with == hub_module.EVICT_CLOSE_CODE
+    assert "agent_1" not in hub.connections
+    # Detached, not removed: it may still resume within the grace period
+    assert "agent_1" in hub.states
+    assert hub.is_member("s1", "agent_1")
+
+def test_resume_replays_missed_frames():
+    async def scenario():
+        hub = _hub()
+        first = FakeSocket()
+        connection = hub.connect("caller_1", first)
+        await hub.join("s1", "caller_1")
+        await hub.deliver({"session_id": "s1", "frame": {"type": "offer", "sdp": "a"}})
+        await _settle()
+        await hub.detach("caller_1", connection)
+        await hub.deliver({"session_id": "s1", "frame": {"type": "ice_candidate", "candidate": {}}})
+        second = FakeSocket()
+        hub.connect("caller_1", second, last_seq=first.frames[-1]["signal_seq"])
+        await _settle()
+        await _close(hub)
+        return first, second, hub
+
+    first, second, hub = asyncio.run(scenario())
+    assert first.types() == ["offer"]
+    assert second.types() == ["ice_candidate", "resumed"]
+    assert second.frames[-1]["replayed"] == 1
+    assert hub.is_member("s1", "caller_1")
+
+def test_resume_fails_once_frames_left_the_buffer():
+    async def scenario():
+        hub = _hub()
+        connection = hub.connect("caller_1", FakeSocket())
+        await hub.join("s1", "caller_1")
+        await hub.detach("caller_1", connection)
+        for i in range(hub_module.REPLAY_BUFFER_SIZE + 1):
+            await hub.deliver({"session_id": "s1", "frame": {"type": "offer", "sdp": str(i)}})
+        socket = FakeSocket()
+        hub.connect("caller_1", socket, last_seq=0)
+        await _settle()
+        await _close(hub)
+        return socket
+
+    assert asyncio.run(scenario()).types() == ["resume_failed"]
+
+def test_expired_client_sends_call_ended_to_peers(monkeypatch):
+    monkeypatch.setattr(hub_module, "RESUME_GRACE", 0.01)
+
+    async def scenario():
+        hub = _hub()
+        caller = hub.connect("caller_1", FakeSocket())
+        agent_socket = FakeSocket()
+        hub.connect("agent_1", agent_socket)
+        await hub.join("s1", "caller_1")
+        await hub.join("s1", "agent_1")
+        await hub.detach("caller_1", caller)
+        await asyncio.sleep(0.05)
+        await _settle()
+        await _close(hub)
+        return hub, agent_socket
+
+    hub, agent_socket = asyncio.run(scenario())
+    assert agent_socket.types() == ["call_ended"]
+    assert "caller_1" not in hub.states
+    # call_ended drops the session on every process that watches it
+    assert "s1" not in hub.session_members
+    assert not hub.client_sessions
+
+def test_session_reaper_keeps_sessions_with_a_live_member(monkeypatch):
+    monkeypatch.setattr(hub_module, "SESSION_IDLE_TIMEOUT", 0.01)
+
+    async def scenario():
+        hub = _hub()
+        hub.connect("caller_1", FakeSocket())
+        await hub.join("s1", "caller_1")
+        # Joined on this process but connected elsewhere: nothing keeps s2 alive
+        await hub.join("s2", "agent_1")
+        await asyncio.sleep(0.02)
+        await hub.heartbeat()
+        await _close(hub)
+        return hub
+
+    hub = asyncio.run(scenario())
+    assert hub.is_member("s1", "caller_1")
+    assert "s2" not in hub.session_members
+    assert "s2" not in hub.session_activity
@@ -0,0 +1,84 @@
+"""Range parsing and the streaming recording response"""
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import media
+from app.media import RangeFileResponse, _parse_range
+
+BODY = bytes(range(256)) * 40
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Several pread()s per response
+    monkeypatch.setattr(media, "CHUNK_SIZE", 1000)
+    path = os.path.join(tmp_path, "call.webm")
+    with open(path, "wb") as f:
+        f.write(BODY)
+
+    async def download(request):
+        return RangeFileResponse(path, request.headers)
+
+    return TestClient(Starlette(routes=[Route("/file", download)]))
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    ("BYTES = 1-2", (1, 2)),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5-4", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 1000)
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "items=0-1", "bytes=-", "bytes=a-b", "bytes=1-2-3"])
+def test_parse_range_served_in_full(header):
+    assert _parse_range(header, 1000) is None
+
+def test_partial_body_is_exact(client):
+    response = client.get("/file", headers={"Range": "bytes=999-2500"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 999-2500/{len(BODY)}"
+    assert response.headers["content-length"] == "1502"
+    assert response.content == BODY[999:2501]
+
+def test_suffix_and_open_ended_ranges(client):
+    suffix = client.get("/file", headers={"Range": "bytes=-10"})
+    assert suffix.status_code == 206
+    assert suffix.content == BODY[-10:]
+    open_ended = client.get("/file", headers={"Range": "bytes=10000-"})
+    assert open_ended.status_code == 206
+    assert open_ended.content == BODY[10000:]
+
+def test_start_beyond_eof_is_416(client):
+    response = client.get("/file", headers={"Range": f"bytes={len(BODY)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(BODY)}"
+    assert response.content == b""
+
+def test_multi_range_and_malformed_headers_get_the_full_body(client):
+    for header in ("bytes=0-1,5-6", "bytes=x-y"):
+        response = client.get("/file", headers={"Range": header})
+        assert response.status_code == 200
+        assert response.content == BODY
+
+def test_if_none_match_is_304(client):
+    etag = client.get("/file").headers["etag"]
+    response = client.get("/file", headers={"If-None-Match": f"W/{etag}", "Range": "bytes=0-1"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert "content-length" not in response.headers
+
+def test_stale_if_range_gets_the_full_body(client):
+    response = client.get("/file", headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == BODY
@@ -0,0 +1,24 @@
+"""OTP verify script under parallel guesses"""
+import asyncio
+
+from app.otp_store import OTPStore
+
+def test_otp_parallel_guesses_stop_at_max_attempts(redis_factory):
+    async def scenario():
+        store = OTPStore(redis_factory())
+        await store.set_otp("admin", "123456")
+        guesses = await asyncio.gather(*[store.verify_otp("admin", f"{i:06d}") for i in range(10)])
+        return guesses, await store.verify_otp("admin", "123456")
+
+    guesses, correct_after = asyncio.run(scenario())
+    assert not any(guesses)
+    # Attempts exhausted: the code is gone even for the right guess
+    assert correct_after is False
+
+def test_otp_code_is_consumed_once(redis_factory):
+    async def scenario():
+        store = OTPStore(redis_factory())
+        await store.set_otp("admin", "123456")
+        return await asyncio.gather(*[store.verify_otp("admin", "123456") for _ in range(10)])
+
+    assert asyncio.run(scenario()).count(True) == 1
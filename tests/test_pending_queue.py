@@ -0,0 +1,36 @@
+"""Pending queue claim under concurrent agents"""
+import asyncio
+from datetime import datetime
+
+from app.pending_queue import PendingQueue
+
+def _call(session_id: str) -> dict:
+    return {"id": 1, "session_id": session_id, "caller_name": "Test",
+            "start_time": datetime.utcnow().isoformat()}
+
+def test_pending_claim_has_one_winner(redis_factory):
+    async def scenario():
+        async def load_pending():
+            return []
+        queue = PendingQueue(redis_factory(), load_pending)
+        await queue.rebuild()
+        await queue.add(_call("s1"))
+        results = await asyncio.gather(*[queue.claim("s1") for _ in range(20)])
+        return results, await queue.count()
+
+    results, remaining = asyncio.run(scenario())
+    winners = [r for r in results if r is not None]
+    assert len(winners) == 1
+    assert winners[0]["session_id"] == "s1"
+    assert remaining == 0
+
+def test_pending_claim_rebuilds_cold_queue(redis_factory):
+    async def scenario():
+        async def load_pending():
+            return [_call("s1")]
+        queue = PendingQueue(redis_factory(), load_pending)
+        return await queue.claim("s1"), await queue.claim("s1")
+
+    first, second = asyncio.run(scenario())
+    assert first["session_id"] == "s1"
+    assert second is None
@@ -0,0 +1,49 @@
+"""Call quota reserve/release script"""
+import asyncio
+from types import SimpleNamespace
+
+from app import quota as quota_module
+from app.quota import CallQuota
+
+def test_quota_reserve_never_exceeds_limit(redis_factory):
+    async def scenario():
+        quota = CallQuota(redis_factory(), limit=3, window=86400)
+        # Seeded counter: skip the cold-start DB rebuild
+        await quota.redis.set(quota._key(quota._bucket()), 0)
+        results = await asyncio.gather(*[quota.reserve() for _ in range(20)])
+        await quota.release(next(r for r in results if r is not None))
+        after_release = await quota.reserve()
+        return results, after_release, await quota.reserve()
+
+    results, after_release, over = asyncio.run(scenario())
+    assert len([r for r in results if r is not None]) == 3
+    assert after_release is not None
+    assert over is None
+
+def test_quota_release_never_goes_negative(redis_factory):
+    async def scenario():
+        quota = CallQuota(redis_factory(), limit=1, window=86400)
+        key = quota._key(quota._bucket())
+        await quota.redis.set(key, 0)
+        await quota.release(key)
+        return await quota.redis.get(key)
+
+    assert asyncio.run(scenario()) == "0"
+
+def test_release_returns_the_slot_to_the_window_it_came_from(redis_factory, monkeypatch):
+    now = [86400 * 100 - 1]
+    monkeypatch.setattr(quota_module, "time", SimpleNamespace(time=lambda: now[0]))
+
+    async def scenario():
+        quota = CallQuota(redis_factory(), limit=5, window=86400)
+        old_key = quota._key(quota._bucket())
+        await quota.redis.set(old_key, 0)
+        reservation = await quota.reserve()
+        # The accept fails just after midnight UTC
+        now[0] += 1
+        new_key = quota._key(quota._bucket())
+        await quota.redis.set(new_key, 2)
+        await quota.release(reservation)
+        return await quota.redis.get(old_key), await quota.redis.get(new_key)
+
+    assert asyncio.run(scenario()) == ("0", "2")
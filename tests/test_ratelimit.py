@@ -0,0 +1,130 @@
+"""Token buckets, the shared Redis limiter and client IP resolution"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import ratelimit
+from app.ratelimit import Policy, RateLimiter, SocketRateLimit, TokenBucket, client_ip
+
+class Clock:
+    """Stands in for the time module: monotonic() for local buckets, time() for Redis"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+POLICY = Policy("test", rate=2, burst=3)
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert bucket.take() is True
+    assert bucket.take() is False
+    # Never above burst however long it idles
+    clock.now += 3600
+    assert [bucket.take() for _ in range(4)] == [True, True, True, False]
+
+def test_limiter_denies_with_retry_after_then_refills(redis_factory, clock):
+    async def scenario():
+        limiter = RateLimiter(redis_factory())
+        decisions = [await limiter.hit(POLICY, "1.2.3.4") for _ in range(4)]
+        clock.now += 0.5
+        return decisions, await limiter.hit(POLICY, "1.2.3.4"), await limiter.hit(POLICY, "5.6.7.8")
+
+    decisions, refilled, other = asyncio.run(scenario())
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert decisions[0].headers() == {"RateLimit-Limit": "3", "RateLimit-Remaining": "2", "RateLimit-Reset": "1"}
+    denied = decisions[-1].headers()
+    assert denied["RateLimit-Remaining"] == "0"
+    assert denied["Retry-After"] == "1"
+    assert "Retry-After" not in decisions[0].headers()
+    assert refilled.allowed and other.allowed
+
+def test_shared_bucket_spans_processes(redis_factory, clock):
+    async def scenario():
+        first, second = RateLimiter(redis_factory()), RateLimiter(redis_factory())
+        results = [await first.hit(POLICY, "ip") for _ in range(2)]
+        results += [await second.hit(POLICY, "ip") for _ in range(2)]
+        return [d.allowed for d in results]
+
+    # The second process still has local tokens, the shared bucket does not
+    assert asyncio.run(scenario()) == [True, True, True, False]
+
+def test_local_bucket_refuses_without_redis(redis_factory, clock):
+    calls = []
+
+    async def scenario():
+        limiter = RateLimiter(redis_factory())
+        script = limiter._bucket
+
+        async def counting(**kwargs):
+            calls.append(kwargs)
+            return await script(**kwargs)
+
+        limiter._bucket = counting
+        return [await limiter.hit(POLICY, "ip") for _ in range(5)]
+
+    decisions = asyncio.run(scenario())
+    assert [d.allowed for d in decisions] == [True, True, True, False, False]
+    assert len(calls) == 3
+
+def test_limiter_fails_open_when_redis_errors(redis_factory, clock):
+    async def scenario():
+        limiter = RateLimiter(redis_factory())
+
+        async def broken(**kwargs):
+            raise ConnectionError("redis down")
+
+        limiter._bucket = broken
+        return await limiter.hit(POLICY, "ip")
+
+    assert asyncio.run(scenario()).allowed
+
+def test_local_buckets_are_bounded(redis_factory, clock):
+    async def scenario():
+        limiter = RateLimiter(redis_factory(), local_size=2)
+        for identity in ("a", "b", "c"):
+            await limiter.hit(POLICY, identity)
+        return list(limiter._local)
+
+    assert asyncio.run(scenario()) == ["ratelimit:test:b", "ratelimit:test:c"]
+
+PEER = SimpleNamespace(host="10.0.0.9")
+
+def test_client_ip_ignores_forwarded_for_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 0)
+    assert client_ip({"x-forwarded-for": "1.1.1.1"}, PEER) == "10.0.0.9"
+    assert client_ip({}, None) == "unknown"
+
+def test_client_ip_takes_the_entry_of_the_outermost_trusted_proxy(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 1)
+    # The client forged the first entry, the proxy appended the real peer
+    assert client_ip({"x-forwarded-for": "6.6.6.6, 203.0.113.7"}, PEER) == "203.0.113.7"
+    assert client_ip({}, PEER) == "10.0.0.9"
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", 2)
+    assert client_ip({"x-forwarded-for": "6.6.6.6, 203.0.113.7, 10.0.0.2"}, PEER) == "203.0.113.7"
+    # Fewer hops than trusted proxies: the leftmost is all there is
+    assert client_ip({"x-forwarded-for": "203.0.113.7"}, PEER) == "203.0.113.7"
+
+def test_socket_rate_limit_drops_then_closes(clock):
+    limit = SocketRateLimit(rate=10, burst=5, max_drops=3)
+    assert [limit.allow() for _ in range(5)] == [True] * 5
+    assert [limit.allow() for _ in range(3)] == [False] * 3
+    assert not limit.exceeded
+    clock.now += 0.25
+    assert limit.allow() and limit.allow()
+    assert not limit.allow()
+    assert limit.exceeded
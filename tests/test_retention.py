@@ -0,0 +1,83 @@
+"""Recording retention sweeps over a temporary recordings directory"""
+import os
+import time
+import asyncio
+import uuid
+
+from app import crud
+from app.retention import RetentionSweeper
+
+def _file(root, name: str, size: int = 100, age: float = 0) -> str:
+    path = os.path.join(root, name)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+async def _recorded(path: str) -> int:
+    recording = await crud.save_recording(uuid.uuid4().hex, "session", path, os.path.getsize(path))
+    return recording.id
+
+def _sweeper(root, **policy) -> RetentionSweeper:
+    return RetentionSweeper(None, root=str(root), io_pause=0, **policy)
+
+def test_recordings_older_than_max_age_are_deleted(db, tmp_path):
+    async def scenario():
+        old = _file(tmp_path, "old.webm", age=3 * 86400)
+        new = _file(tmp_path, "new.webm", age=60)
+        old_id, new_id = await _recorded(old), await _recorded(new)
+        await _sweeper(tmp_path, max_age_days=1).sweep()
+        return old, new, await crud.get_recording(old_id), await crud.get_recording(new_id)
+
+    old, new, old_row, new_row = asyncio.run(scenario())
+    assert not os.path.exists(old) and old_row is None
+    assert os.path.exists(new) and new_row is not None
+
+def test_quota_evicts_oldest_recordings_first(db, tmp_path):
+    async def scenario():
+        paths = [_file(tmp_path, f"{i}.webm", size=100, age=400 - i * 100) for i in range(4)]
+        for path in paths:
+            await _recorded(path)
+        sweeper = _sweeper(tmp_path, max_bytes=250)
+        await sweeper.sweep()
+        return paths, sweeper.stats["total_bytes"]
+
+    paths, total = asyncio.run(scenario())
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert total == 200
+
+def test_rows_whose_file_is_gone_are_dropped(db, tmp_path):
+    async def scenario():
+        kept = _file(tmp_path, "kept.webm")
+        kept_id = await _recorded(kept)
+        gone = _file(tmp_path, "gone.webm")
+        gone_id = await _recorded(gone)
+        os.remove(gone)
+        await _sweeper(tmp_path).sweep()
+        return await crud.get_recording(kept_id), await crud.get_recording(gone_id)
+
+    kept_row, gone_row = asyncio.run(scenario())
+    assert kept_row is not None
+    assert gone_row is None
+
+def test_files_being_recorded_are_never_touched(db, tmp_path):
+    async def scenario():
+        # No row yet and newer than the orphan grace: a recording in progress
+        live = _file(tmp_path, "live.webm", size=1000, age=10)
+        orphan = _file(tmp_path, "orphan.webm", age=7200)
+        await _sweeper(tmp_path, max_age_days=0.0001, max_bytes=1,
+                       orphan_grace=3600, delete_orphans=True).sweep()
+        return live, orphan
+
+    live, orphan = asyncio.run(scenario())
+    assert os.path.exists(live)
+    assert not os.path.exists(orphan)
+
+def test_orphan_files_are_kept_unless_enabled(db, tmp_path):
+    async def scenario():
+        orphan = _file(tmp_path, "orphan.webm", age=7200)
+        await _sweeper(tmp_path, max_bytes=1, orphan_grace=3600).sweep()
+        return orphan
+
+    assert os.path.exists(asyncio.run(scenario()))